@@ -1,370 +1,700 @@
-import requests
-import json
+import asyncio
+import atexit
 import logging
-from typing import Optional, Dict, Any
-from config import settings
+import threading
+import time
+from operator import attrgetter
+from string import Template
+from typing import Optional, Dict, List
+import aiohttp
+from config import settings, get_settings
+import json_utils
 from models import PPEComplianceRecord
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from slack_sdk import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
 from slack_sdk.errors import SlackApiError
-from twilio.rest import Client as TwilioClient
 
 logger = logging.getLogger(__name__)
 
+SENDGRID_SEND_URL = "https://api.sendgrid.com/v3/mail/send"
+TWILIO_MESSAGES_URL = "https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
+
+ALERT_CHANNELS = ("slack", "email", "whatsapp")
+
+# Per-request timeout for every alert provider call, in seconds
+PROVIDER_TIMEOUT = 5
+
+# Cheap endpoints used to open TLS connections to each provider ahead of the first alert
+_WARMUP_URLS = {
+    "slack": "https://slack.com/api/api.test",
+    "email": "https://api.sendgrid.com/v3/",
+    "whatsapp": "https://api.twilio.com/"
+}
+
+# Email alerts arriving within this window share one SendGrid request
+EMAIL_BATCH_WINDOW = 0.2
+
+# SendGrid accepts at most 1000 personalizations per request
+SENDGRID_MAX_PERSONALIZATIONS = 1000
+
+# Alert recipients - customize these for your organization's structure
+_DEFAULT_EMAIL_RECIPIENTS = (
+    "safety@yourcompany.com",
+    "supervisor@yourcompany.com"
+)
+
+_DEPT_EMAIL_RECIPIENTS = {
+    "production": ("production-manager@yourcompany.com",),
+    "maintenance": ("maintenance-manager@yourcompany.com",),
+    "warehouse": ("warehouse-manager@yourcompany.com",)
+}
+
+_DEFAULT_WHATSAPP_RECIPIENTS = (
+    "+1234567890",  # Safety manager
+    "+1234567891"   # Supervisor
+)
+
+_DEPT_WHATSAPP_RECIPIENTS = {
+    "production": ("+1234567892",),
+    "maintenance": ("+1234567893",),
+    "warehouse": ("+1234567894",)
+}
+
+# Static message fragments, built once at import and reused for every alert
+_PPE_ITEMS = (
+    ("helmet", "🪖", "Helmet"),
+    ("mask", "😷", "Mask"),
+    ("gloves", "🧤", "Gloves"),
+    ("jacket", "🦺", "Jacket")
+)
+
+# Precomputed (detected, confidence) getters for each PPE item
+_PPE_GETTERS = tuple(
+    (key, emoji, label, attrgetter(f"{key}_detected", f"{key}_confidence"))
+    for key, emoji, label in _PPE_ITEMS
+)
+
+def _iter_ppe(record: PPEComplianceRecord):
+    """Yield (key, emoji, label, detected, confidence) for each PPE item"""
+    for key, emoji, label, getter in _PPE_GETTERS:
+        detected, confidence = getter(record)
+        yield key, emoji, label, detected, confidence
+
+_SLACK_HEADER_BLOCK = {
+    "type": "header",
+    "text": {
+        "type": "plain_text",
+        "text": "🚨 PPE Compliance Alert"
+    }
+}
+
+_SLACK_DIVIDER_BLOCK = {"type": "divider"}
+
+_EMAIL_CSS = """
+            <style>
+                body { font-family: Arial, sans-serif; margin: 0; padding: 20px; }
+                .container { max-width: 600px; margin: 0 auto; }
+                .header { background-color: $status_color; color: white; padding: 20px; text-align: center; }
+                .content { padding: 20px; background-color: #f8f9fa; }
+                .details { background-color: white; padding: 15px; margin: 10px 0; border-radius: 5px; }
+                .ppe-item { margin: 5px 0; }
+                .compliant { color: #28a745; }
+                .non-compliant { color: #dc3545; }
+            </style>
+"""
+
+_EMAIL_TEMPLATE = Template("""
+        <!DOCTYPE html>
+        <html>
+        <head>""" + _EMAIL_CSS + """        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>🚨 PPE Compliance Alert</h1>
+                    <h2>Status: $status_text</h2>
+                </div>
+                <div class="content">
+                    <div class="details">
+                        <h3>Worker Information</h3>
+                        <p><strong>Name:</strong> $worker_name</p>
+                        <p><strong>ID:</strong> $worker_id</p>
+                        <p><strong>Department:</strong> $department</p>
+                        <p><strong>Location:</strong> $location</p>
+                        <p><strong>Shift:</strong> $shift</p>
+                        <p><strong>Time:</strong> $timestamp</p>
+                    </div>
+                    
+                    <div class="details">
+                        <h3>Compliance Score: $compliance_score%</h3>
+                    </div>
+                    
+                    <div class="details">
+                        <h3>PPE Detection Results</h3>
+$ppe_items
+                    </div>
+                </div>
+            </div>
+        </body>
+        </html>
+        """)
+
+_EMAIL_PPE_ITEM_TEMPLATE = Template("""                        <div class="ppe-item">
+                            $emoji $label: $status
+                            $confidence
+                        </div>""")
+
+# Batched emails carry their bodies as per-personalization substitutions
+_EMAIL_BATCH_CONTENT = [
+    {"type": "text/plain", "value": "-text_body-"},
+    {"type": "text/html", "value": "-html_body-"}
+]
+
+_EMAIL_TEXT_TEMPLATE = Template("""
+PPE COMPLIANCE ALERT
+===================
+
+Worker: $worker_name (ID: $worker_id)
+Department: $department
+Location: $location
+Shift: $shift
+Time: $timestamp
+
+Compliance Score: $compliance_score%
+Status: $status_text
+
+PPE Detection Results:
+$ppe_items
+
+Please take appropriate action to ensure worker safety compliance.
+        """)
+
+_WHATSAPP_TEMPLATE = Template("""
+🚨 *PPE Compliance Alert*
+
+*Worker:* $worker_name
+*ID:* $worker_id
+*Department:* $department
+*Location:* $location
+*Time:* $timestamp
+
+*Compliance Score:* $compliance_score%
+*Status:* $status_text
+
+*PPE Detection:*
+$ppe_items
+
+Please take immediate action if non-compliant.
+            """)
+
+def _record_fields(record: PPEComplianceRecord) -> Dict[str, str]:
+    """Per-record values shared by every alert renderer, formatted once per dispatch"""
+    return {
+        "worker_name": record.worker_name,
+        "worker_id": record.worker_id,
+        "department": record.department or 'Unknown',
+        "location": record.location or 'Unknown',
+        "shift": record.shift or 'Unknown',
+        "timestamp": record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        "compliance_score": f"{record.compliance_score:.1f}"
+    }
+
+# Alerts run on one long-lived event loop so that a single pooled HTTP session
+# (and its keep-alive connections to Slack, SendGrid and Twilio) can be shared
+# by every AlertService instance
+_alert_loop: Optional[asyncio.AbstractEventLoop] = None
+_http_session: Optional[aiohttp.ClientSession] = None
+_alert_loop_lock = threading.Lock()
+
+async def _create_http_session() -> aiohttp.ClientSession:
+    """Create the pooled HTTP session used for all alert providers"""
+    connector = aiohttp.TCPConnector(
+        limit=100,
+        limit_per_host=20,
+        keepalive_timeout=60,
+        ttl_dns_cache=300
+    )
+    # Request bodies (Slack blocks, SendGrid payloads) are encoded with orjson when available
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=PROVIDER_TIMEOUT),
+        json_serialize=json_utils.dumps
+    )
+
+def _get_alert_loop() -> asyncio.AbstractEventLoop:
+    """Start the alert event loop thread and HTTP session on first use"""
+    global _alert_loop, _http_session
+    
+    with _alert_loop_lock:
+        if _alert_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="alert-dispatch", daemon=True).start()
+            _http_session = asyncio.run_coroutine_threadsafe(_create_http_session(), loop).result()
+            _alert_loop = loop
+            atexit.register(_close_http_session)
+    
+    return _alert_loop
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Get the shared pooled HTTP session for alert providers"""
+    _get_alert_loop()
+    return _http_session
+
+def _close_http_session():
+    """Close the shared HTTP session and stop the alert loop"""
+    if _alert_loop is None:
+        return
+    
+    try:
+        if _http_session and not _http_session.closed:
+            asyncio.run_coroutine_threadsafe(_http_session.close(), _alert_loop).result(timeout=5)
+    except Exception as e:
+        logger.error(f"Error closing alert HTTP session: {str(e)}")
+    finally:
+        _alert_loop.call_soon_threadsafe(_alert_loop.stop)
+
+def run_sync(coro):
+    """Run an alert coroutine on the alert loop and block until it completes"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_alert_loop()).result()
+
+class CircuitBreaker:
+    """Skip calls to a failing alert provider until it has had time to recover"""
+    
+    def __init__(self, name: str, fail_max: int = 5, reset_timeout: float = 60):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted (closed, or the single half-open trial call)"""
+        if self.opened_at is None:
+            return True
+        
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            return False
+        
+        # Half-open: one trial call goes through and the rest stay short-circuited
+        # until it reports back (or until it is presumed lost after reset_timeout)
+        if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+            return False
+        self.trial_started_at = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_started_at = None
+        if self.failures >= self.fail_max:
+            if self.opened_at is None:
+                logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
 class AlertService:
     def __init__(self):
         self.slack_client = None
-        self.twilio_client = None
-        self.sendgrid_client = None
+        self.twilio_auth = None
+        self.sendgrid_headers = None
+        self._email_queue = None
+        self._email_batcher = None
+        
+        # Breaker state lives on the service so it persists across checks;
+        # it is only touched from the alert event loop
+        self.breakers = {
+            "slack": CircuitBreaker("Slack"),
+            "email": CircuitBreaker("SendGrid"),
+            "whatsapp": CircuitBreaker("Twilio")
+        }
+        
+        s = get_settings()
         
         # Initialize Slack client
-        if settings.SLACK_BOT_TOKEN:
-            self.slack_client = WebClient(token=settings.SLACK_BOT_TOKEN)
+        if s.SLACK_BOT_TOKEN:
+            self.slack_client = AsyncWebClient(
+                token=s.SLACK_BOT_TOKEN,
+                session=get_http_session(),
+                timeout=PROVIDER_TIMEOUT
+            )
         
-        # Initialize Twilio client for WhatsApp
-        if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
-            self.twilio_client = TwilioClient(
-                settings.TWILIO_ACCOUNT_SID, 
-                settings.TWILIO_AUTH_TOKEN
+        # Initialize Twilio credentials for WhatsApp
+        if s.TWILIO_ACCOUNT_SID and s.TWILIO_AUTH_TOKEN:
+            self.twilio_auth = aiohttp.BasicAuth(
+                s.TWILIO_ACCOUNT_SID, 
+                s.TWILIO_AUTH_TOKEN
             )
         
-        # Initialize SendGrid client for email
-        if settings.SENDGRID_API_KEY:
-            self.sendgrid_client = SendGridAPIClient(api_key=settings.SENDGRID_API_KEY)
+        # Initialize SendGrid credentials for email
+        if s.SENDGRID_API_KEY:
+            self.sendgrid_headers = {"Authorization": f"Bearer {s.SENDGRID_API_KEY}"}
 
-    def send_slack_alert(self, message: str, record: PPEComplianceRecord) -> bool:
+    def configured_channels(self) -> List[str]:
+        """Alert channels whose provider credentials are configured"""
+        configured = {
+            "slack": self.slack_client and settings.SLACK_CHANNEL_ID,
+            "email": self.sendgrid_headers,
+            "whatsapp": self.twilio_auth
+        }
+        return [channel for channel in ALERT_CHANNELS if configured[channel]]
+
+    def warm_connections(self):
+        """Warm the connection pool in the background (called at app startup) so the
+        first alert does not pay for the TCP and TLS handshakes"""
+        urls = [_WARMUP_URLS[channel] for channel in self.configured_channels()]
+        if urls:
+            asyncio.run_coroutine_threadsafe(self._warm_connections(urls), _get_alert_loop())
+
+    async def _warm_connections(self, urls: List[str]):
+        """Issue a HEAD request per provider so keep-alive connections land in the pool"""
+        async def warm(url: str):
+            try:
+                async with _http_session.head(url):
+                    pass
+            except Exception as e:
+                logger.warning(f"Connection warm-up failed for {url}: {str(e)}")
+        
+        await asyncio.gather(*(warm(url) for url in urls))
+
+    async def send_slack_alert(self, message: str, record: PPEComplianceRecord,
+                               fields: Optional[Dict[str, str]] = None) -> bool:
         """Send alert to Slack channel"""
-        if not self.slack_client or not settings.SLACK_CHANNEL_ID:
+        channel_id = settings.SLACK_CHANNEL_ID
+        if not self.slack_client or not channel_id:
             logger.warning("Slack not configured")
             return False
         
+        breaker = self.breakers["slack"]
+        if not breaker.allow():
+            logger.warning("Slack circuit open, skipping alert")
+            return False
+        
         try:
             # Create rich message with blocks
-            blocks = self._create_slack_blocks(message, record)
+            blocks = self._create_slack_blocks(message, record, fields or _record_fields(record))
             
-            response = self.slack_client.chat_postMessage(
-                channel=settings.SLACK_CHANNEL_ID,
+            response = await self.slack_client.chat_postMessage(
+                channel=channel_id,
                 text=message,
                 blocks=blocks
             )
             
             logger.info(f"Slack alert sent successfully: {response['ts']}")
+            breaker.record_success()
             return True
             
         except SlackApiError as e:
             logger.error(f"Slack API error: {e.response['error']}")
+            breaker.record_failure()
             return False
         except Exception as e:
             logger.error(f"Error sending Slack alert: {str(e)}")
+            breaker.record_failure()
             return False
 
-    def _create_slack_blocks(self, message: str, record: PPEComplianceRecord) -> list:
+    def _create_slack_blocks(self, message: str, record: PPEComplianceRecord, fields: Dict[str, str]) -> list:
         """Create Slack blocks for rich message formatting"""
-        # Determine color based on compliance
-        color = "#ff0000" if not record.is_compliant else "#00ff00"
-        
-        blocks = [
-            {
-                "type": "header",
-                "text": {
-                    "type": "plain_text",
-                    "text": "🚨 PPE Compliance Alert"
+        summary_block = {
+            "type": "section",
+            "fields": [
+                {
+                    "type": "mrkdwn",
+                    "text": f"*Worker:* {fields['worker_name']}\n*ID:* {fields['worker_id']}"
+                },
+                {
+                    "type": "mrkdwn",
+                    "text": f"*Department:* {fields['department']}\n*Location:* {fields['location']}"
+                },
+                {
+                    "type": "mrkdwn",
+                    "text": f"*Time:* {fields['timestamp']}\n*Shift:* {fields['shift']}"
+                },
+                {
+                    "type": "mrkdwn",
+                    "text": f"*Compliance Score:* {record.compliance_score:.1f}%\n*Status:* {'✅ Compliant' if record.is_compliant else '❌ Non-Compliant'}"
                 }
-            },
-            {
-                "type": "section",
-                "fields": [
-                    {
-                        "type": "mrkdwn",
-                        "text": f"*Worker:* {record.worker_name}\n*ID:* {record.worker_id}"
-                    },
-                    {
-                        "type": "mrkdwn",
-                        "text": f"*Department:* {record.department or 'Unknown'}\n*Location:* {record.location or 'Unknown'}"
-                    },
-                    {
-                        "type": "mrkdwn",
-                        "text": f"*Time:* {record.timestamp.strftime('%Y-%m-%d %H:%M:%S')}\n*Shift:* {record.shift or 'Unknown'}"
-                    },
-                    {
-                        "type": "mrkdwn",
-                        "text": f"*Compliance Score:* {record.compliance_score:.1f}%\n*Status:* {'✅ Compliant' if record.is_compliant else '❌ Non-Compliant'}"
-                    }
-                ]
-            }
-        ]
+            ]
+        }
         
         # Add PPE detection details
-        ppe_details = []
-        if record.helmet_detected:
-            ppe_details.append(f"🪖 Helmet: ✅ ({record.helmet_confidence:.1%})")
-        else:
-            ppe_details.append("🪖 Helmet: ❌")
-            
-        if record.mask_detected:
-            ppe_details.append(f"😷 Mask: ✅ ({record.mask_confidence:.1%})")
-        else:
-            ppe_details.append("😷 Mask: ❌")
-            
-        if record.gloves_detected:
-            ppe_details.append(f"🧤 Gloves: ✅ ({record.gloves_confidence:.1%})")
-        else:
-            ppe_details.append("🧤 Gloves: ❌")
-            
-        if record.jacket_detected:
-            ppe_details.append(f"🦺 Jacket: ✅ ({record.jacket_confidence:.1%})")
-        else:
-            ppe_details.append("🦺 Jacket: ❌")
+        ppe_details = [
+            f"{emoji} {label}: ✅ ({confidence:.1%})" if detected else f"{emoji} {label}: ❌"
+            for _, emoji, label, detected, confidence in _iter_ppe(record)
+        ]
         
-        blocks.append({
+        details_block = {
             "type": "section",
             "text": {
                 "type": "mrkdwn",
                 "text": "*PPE Detection Results:*\n" + "\n".join(ppe_details)
             }
-        })
+        }
         
-        # Add divider
-        blocks.append({"type": "divider"})
-        
-        return blocks
+        return [_SLACK_HEADER_BLOCK, summary_block, details_block, _SLACK_DIVIDER_BLOCK]
 
-    def send_email_alert(self, message: str, record: PPEComplianceRecord) -> bool:
-        """Send alert via email using SendGrid"""
-        if not self.sendgrid_client:
+    async def send_email_alert(self, message: str, record: PPEComplianceRecord,
+                               fields: Optional[Dict[str, str]] = None) -> bool:
+        """Send alert via email using the SendGrid v3 API (batched)"""
+        if not self.sendgrid_headers:
             logger.warning("SendGrid not configured")
             return False
         
+        if not self.breakers["email"].allow():
+            logger.warning("SendGrid circuit open, skipping alert")
+            return False
+        
         try:
             # Create email content
+            fields = fields or _record_fields(record)
             subject = f"PPE Compliance Alert - {record.worker_name} ({record.worker_id})"
+            substitutions = {
+                "-html_body-": self._create_email_html(message, record, fields),
+                "-text_body-": self._create_email_text(message, record, fields)
+            }
             
-            html_content = self._create_email_html(message, record)
-            text_content = self._create_email_text(message, record)
-            
-            mail = Mail(
-                from_email=settings.FROM_EMAIL,
-                to_emails=self._get_alert_recipients(record),
-                subject=subject,
-                html_content=html_content,
-                plain_text_content=text_content
-            )
-            
-            response = self.sendgrid_client.send(mail)
+            # One personalization per recipient
+            personalizations = [
+                {"to": [{"email": recipient}], "subject": subject, "substitutions": substitutions}
+                for recipient in self._get_alert_recipients(record)
+            ]
             
-            if response.status_code in [200, 201, 202]:
-                logger.info(f"Email alert sent successfully: {response.status_code}")
-                return True
-            else:
-                logger.error(f"Email send failed: {response.status_code}")
-                return False
+            return await self._queue_email(personalizations)
                 
         except Exception as e:
             logger.error(f"Error sending email alert: {str(e)}")
             return False
 
-    def _create_email_html(self, message: str, record: PPEComplianceRecord) -> str:
-        """Create HTML content for email alert"""
-        status_color = "#28a745" if record.is_compliant else "#dc3545"
-        status_text = "COMPLIANT" if record.is_compliant else "NON-COMPLIANT"
+    async def _queue_email(self, personalizations: list) -> bool:
+        """Queue personalizations for the next SendGrid batch and wait for the result"""
+        if self._email_queue is None:
+            self._email_queue = asyncio.Queue()
+            self._email_batcher = asyncio.create_task(self._run_email_batcher())
         
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; }}
-                .container {{ max-width: 600px; margin: 0 auto; }}
-                .header {{ background-color: {status_color}; color: white; padding: 20px; text-align: center; }}
-                .content {{ padding: 20px; background-color: #f8f9fa; }}
-                .details {{ background-color: white; padding: 15px; margin: 10px 0; border-radius: 5px; }}
-                .ppe-item {{ margin: 5px 0; }}
-                .compliant {{ color: #28a745; }}
-                .non-compliant {{ color: #dc3545; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🚨 PPE Compliance Alert</h1>
-                    <h2>Status: {status_text}</h2>
-                </div>
-                <div class="content">
-                    <div class="details">
-                        <h3>Worker Information</h3>
-                        <p><strong>Name:</strong> {record.worker_name}</p>
-                        <p><strong>ID:</strong> {record.worker_id}</p>
-                        <p><strong>Department:</strong> {record.department or 'Unknown'}</p>
-                        <p><strong>Location:</strong> {record.location or 'Unknown'}</p>
-                        <p><strong>Shift:</strong> {record.shift or 'Unknown'}</p>
-                        <p><strong>Time:</strong> {record.timestamp.strftime('%Y-%m-%d %H:%M:%S')}</p>
-                    </div>
-                    
-                    <div class="details">
-                        <h3>Compliance Score: {record.compliance_score:.1f}%</h3>
-                    </div>
-                    
-                    <div class="details">
-                        <h3>PPE Detection Results</h3>
-                        <div class="ppe-item">
-                            🪖 Helmet: {'<span class="compliant">✅ Detected</span>' if record.helmet_detected else '<span class="non-compliant">❌ Missing</span>'}
-                            {f' (Confidence: {record.helmet_confidence:.1%})' if record.helmet_detected else ''}
-                        </div>
-                        <div class="ppe-item">
-                            😷 Mask: {'<span class="compliant">✅ Detected</span>' if record.mask_detected else '<span class="non-compliant">❌ Missing</span>'}
-                            {f' (Confidence: {record.mask_confidence:.1%})' if record.mask_detected else ''}
-                        </div>
-                        <div class="ppe-item">
-                            🧤 Gloves: {'<span class="compliant">✅ Detected</span>' if record.gloves_detected else '<span class="non-compliant">❌ Missing</span>'}
-                            {f' (Confidence: {record.gloves_confidence:.1%})' if record.gloves_detected else ''}
-                        </div>
-                        <div class="ppe-item">
-                            🦺 Jacket: {'<span class="compliant">✅ Detected</span>' if record.jacket_detected else '<span class="non-compliant">❌ Missing</span>'}
-                            {f' (Confidence: {record.jacket_confidence:.1%})' if record.jacket_detected else ''}
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        return html
+        future = asyncio.get_running_loop().create_future()
+        await self._email_queue.put((personalizations, future))
+        return await future
 
-    def _create_email_text(self, message: str, record: PPEComplianceRecord) -> str:
-        """Create plain text content for email alert"""
-        text = f"""
-PPE COMPLIANCE ALERT
-===================
+    async def _run_email_batcher(self):
+        """Collect queued emails for EMAIL_BATCH_WINDOW and send them together"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await self._email_queue.get()]
+            deadline = loop.time() + EMAIL_BATCH_WINDOW
+            
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._email_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                await self._send_email_batch(batch)
+            except Exception as e:
+                logger.error(f"Error sending email batch: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(False)
 
-Worker: {record.worker_name} (ID: {record.worker_id})
-Department: {record.department or 'Unknown'}
-Location: {record.location or 'Unknown'}
-Shift: {record.shift or 'Unknown'}
-Time: {record.timestamp.strftime('%Y-%m-%d %H:%M:%S')}
+    async def _send_email_batch(self, batch: list):
+        """Send queued emails, packing whole alerts into as few requests as possible"""
+        request_items = []
+        request_size = 0
+        
+        for item in batch:
+            if request_items and request_size + len(item[0]) > SENDGRID_MAX_PERSONALIZATIONS:
+                await self._post_email_request(request_items)
+                request_items, request_size = [], 0
+            request_items.append(item)
+            request_size += len(item[0])
+        
+        if request_items:
+            await self._post_email_request(request_items)
 
-Compliance Score: {record.compliance_score:.1f}%
-Status: {'COMPLIANT' if record.is_compliant else 'NON-COMPLIANT'}
+    async def _post_email_request(self, items: list):
+        """POST one SendGrid request and resolve the futures of its alerts"""
+        breaker = self.breakers["email"]
+        payload = {
+            "personalizations": [p for personalizations, _ in items for p in personalizations],
+            "from": {"email": settings.FROM_EMAIL},
+            "content": _EMAIL_BATCH_CONTENT
+        }
+        
+        try:
+            async with _http_session.post(SENDGRID_SEND_URL, json=payload, headers=self.sendgrid_headers) as response:
+                status_code = response.status
+            
+            sent = status_code in [200, 201, 202]
+            if sent:
+                logger.info(f"Email alerts sent successfully: {status_code} ({len(items)} alerts)")
+                breaker.record_success()
+            elif len(items) > 1 and 400 <= status_code < 500:
+                # SendGrid rejects the whole request for one bad personalization
+                # (e.g. an invalid recipient), so resend each alert on its own
+                # to keep one bad alert from failing the rest of the batch
+                logger.warning(f"Email batch rejected: {status_code}, retrying {len(items)} alerts individually")
+                for item in items:
+                    await self._post_email_request([item])
+                return
+            else:
+                logger.error(f"Email send failed: {status_code}")
+                breaker.record_failure()
+                
+        except Exception as e:
+            logger.error(f"Error sending email alerts: {str(e)}")
+            breaker.record_failure()
+            sent = False
+        
+        for _, future in items:
+            if not future.done():
+                future.set_result(sent)
 
-PPE Detection Results:
-- Helmet: {'✅ Detected' if record.helmet_detected else '❌ Missing'} {f'({record.helmet_confidence:.1%})' if record.helmet_detected else ''}
-- Mask: {'✅ Detected' if record.mask_detected else '❌ Missing'} {f'({record.mask_confidence:.1%})' if record.mask_detected else ''}
-- Gloves: {'✅ Detected' if record.gloves_detected else '❌ Missing'} {f'({record.gloves_confidence:.1%})' if record.gloves_detected else ''}
-- Jacket: {'✅ Detected' if record.jacket_detected else '❌ Missing'} {f'({record.jacket_confidence:.1%})' if record.jacket_detected else ''}
+    def _create_email_html(self, message: str, record: PPEComplianceRecord, fields: Dict[str, str]) -> str:
+        """Create HTML content for email alert"""
+        ppe_items = [
+            _EMAIL_PPE_ITEM_TEMPLATE.substitute(
+                emoji=emoji,
+                label=label,
+                status='<span class="compliant">✅ Detected</span>' if detected else '<span class="non-compliant">❌ Missing</span>',
+                confidence=f" (Confidence: {confidence:.1%})" if detected else ''
+            )
+            for _, emoji, label, detected, confidence in _iter_ppe(record)
+        ]
+        
+        return _EMAIL_TEMPLATE.substitute(
+            fields,
+            status_color="#28a745" if record.is_compliant else "#dc3545",
+            status_text="COMPLIANT" if record.is_compliant else "NON-COMPLIANT",
+            ppe_items="\n".join(ppe_items)
+        )
 
-Please take appropriate action to ensure worker safety compliance.
-        """
-        return text
+    def _create_email_text(self, message: str, record: PPEComplianceRecord, fields: Dict[str, str]) -> str:
+        """Create plain text content for email alert"""
+        ppe_items = [
+            f"- {label}: ✅ Detected ({confidence:.1%})" if detected else f"- {label}: ❌ Missing"
+            for _, _, label, detected, confidence in _iter_ppe(record)
+        ]
+        
+        return _EMAIL_TEXT_TEMPLATE.substitute(
+            fields,
+            status_text='COMPLIANT' if record.is_compliant else 'NON-COMPLIANT',
+            ppe_items="\n".join(ppe_items)
+        )
 
-    def send_whatsapp_alert(self, message: str, record: PPEComplianceRecord) -> bool:
-        """Send alert via WhatsApp using Twilio"""
-        if not self.twilio_client:
+    async def send_whatsapp_alert(self, message: str, record: PPEComplianceRecord,
+                                  fields: Optional[Dict[str, str]] = None) -> bool:
+        """Send alert via WhatsApp using the Twilio Messages API"""
+        if not self.twilio_auth:
             logger.warning("Twilio not configured")
             return False
         
+        # Get recipient phone numbers
+        recipients = self._get_whatsapp_recipients(record)
+        if not recipients:
+            logger.warning("No WhatsApp recipients configured")
+            return False
+        
+        if not self.breakers["whatsapp"].allow():
+            logger.warning("Twilio circuit open, skipping alert")
+            return False
+        
         try:
-            # Get recipient phone numbers
-            recipients = self._get_whatsapp_recipients(record)
+            # Create WhatsApp message
+            whatsapp_message = _WHATSAPP_TEMPLATE.substitute(
+                fields or _record_fields(record),
+                status_text='✅ Compliant' if record.is_compliant else '❌ Non-Compliant',
+                ppe_items="\n".join(
+                    f"{emoji} {label}: {'✅' if detected else '❌'}"
+                    for _, emoji, label, detected, _ in _iter_ppe(record)
+                )
+            )
             
-            if not recipients:
-                logger.warning("No WhatsApp recipients configured")
-                return False
+            # Send to all recipients concurrently
+            tasks = [
+                self._send_whatsapp_message(whatsapp_message, recipient)
+                for recipient in recipients
+            ]
+            results = await asyncio.gather(*tasks)
             
-            # Create WhatsApp message
-            whatsapp_message = f"""
-🚨 *PPE Compliance Alert*
-
-*Worker:* {record.worker_name}
-*ID:* {record.worker_id}
-*Department:* {record.department or 'Unknown'}
-*Location:* {record.location or 'Unknown'}
-*Time:* {record.timestamp.strftime('%Y-%m-%d %H:%M:%S')}
-
-*Compliance Score:* {record.compliance_score:.1f}%
-*Status:* {'✅ Compliant' if record.is_compliant else '❌ Non-Compliant'}
-
-*PPE Detection:*
-🪖 Helmet: {'✅' if record.helmet_detected else '❌'}
-😷 Mask: {'✅' if record.mask_detected else '❌'}
-🧤 Gloves: {'✅' if record.gloves_detected else '❌'}
-🦺 Jacket: {'✅' if record.jacket_detected else '❌'}
+            return any(results)
+            
+        except Exception as e:
+            logger.error(f"Error sending WhatsApp alert: {str(e)}")
+            return False
 
-Please take immediate action if non-compliant.
-            """
+    async def _send_whatsapp_message(self, body: str, recipient: str) -> bool:
+        """Send a single WhatsApp message to one recipient"""
+        try:
+            url = TWILIO_MESSAGES_URL.format(account_sid=settings.TWILIO_ACCOUNT_SID)
+            data = {
+                "From": settings.TWILIO_WHATSAPP_NUMBER,
+                "To": f"whatsapp:{recipient}",
+                "Body": body
+            }
             
-            # Send to all recipients
-            success_count = 0
-            for recipient in recipients:
-                try:
-                    message_obj = self.twilio_client.messages.create(
-                        body=whatsapp_message,
-                        from_=settings.TWILIO_WHATSAPP_NUMBER,
-                        to=f"whatsapp:{recipient}"
-                    )
-                    logger.info(f"WhatsApp alert sent to {recipient}: {message_obj.sid}")
-                    success_count += 1
-                except Exception as e:
-                    logger.error(f"Error sending WhatsApp to {recipient}: {str(e)}")
+            async with _http_session.post(url, data=data, auth=self.twilio_auth) as response:
+                response.raise_for_status()
+                message_obj = await response.json()
             
-            return success_count > 0
+            logger.info(f"WhatsApp alert sent to {recipient}: {message_obj.get('sid')}")
+            self.breakers["whatsapp"].record_success()
+            return True
             
         except Exception as e:
-            logger.error(f"Error sending WhatsApp alert: {str(e)}")
+            logger.error(f"Error sending WhatsApp to {recipient}: {str(e)}")
+            self.breakers["whatsapp"].record_failure()
             return False
 
     def _get_alert_recipients(self, record: PPEComplianceRecord) -> list:
         """Get email recipients for alerts"""
-        # This should be configured based on your organization's structure
-        # For now, return a default list - you should customize this
-        default_recipients = [
-            "safety@yourcompany.com",
-            "supervisor@yourcompany.com"
-        ]
-        
-        # Add department-specific recipients
-        if record.department:
-            dept_recipients = {
-                "production": ["production-manager@yourcompany.com"],
-                "maintenance": ["maintenance-manager@yourcompany.com"],
-                "warehouse": ["warehouse-manager@yourcompany.com"]
-            }
-            default_recipients.extend(dept_recipients.get(record.department.lower(), []))
-        
-        return default_recipients
+        dept_recipients = _DEPT_EMAIL_RECIPIENTS.get((record.department or "").lower(), ())
+        return list(_DEFAULT_EMAIL_RECIPIENTS + dept_recipients)
 
     def _get_whatsapp_recipients(self, record: PPEComplianceRecord) -> list:
         """Get WhatsApp recipients for alerts"""
-        # This should be configured based on your organization's structure
-        # For now, return a default list - you should customize this
-        default_recipients = [
-            "+1234567890",  # Safety manager
-            "+1234567891"   # Supervisor
-        ]
-        
-        # Add department-specific recipients
-        if record.department:
-            dept_recipients = {
-                "production": ["+1234567892"],
-                "maintenance": ["+1234567893"],
-                "warehouse": ["+1234567894"]
-            }
-            default_recipients.extend(dept_recipients.get(record.department.lower(), []))
-        
-        return default_recipients
+        dept_recipients = _DEPT_WHATSAPP_RECIPIENTS.get((record.department or "").lower(), ())
+        return list(_DEFAULT_WHATSAPP_RECIPIENTS + dept_recipients)
 
-    def send_custom_alert(self, message: str, channels: list, record: PPEComplianceRecord) -> Dict[str, bool]:
-        """Send custom alert to specified channels"""
-        results = {}
-        
-        if "slack" in channels:
-            results["slack"] = self.send_slack_alert(message, record)
+    async def _dispatch_alerts(self, message: str, channels: list, record: PPEComplianceRecord) -> Dict[str, bool]:
+        """Send alert to the specified channels concurrently (runs on the alert loop)"""
+        senders = {
+            "slack": self.send_slack_alert,
+            "email": self.send_email_alert,
+            "whatsapp": self.send_whatsapp_alert
+        }
+        selected = [channel for channel in ALERT_CHANNELS if channel in channels]
+        fields = _record_fields(record)
         
-        if "email" in channels:
-            results["email"] = self.send_email_alert(message, record)
+        results = await asyncio.gather(
+            *(senders[channel](message, record, fields) for channel in selected),
+            return_exceptions=True
+        )
         
-        if "whatsapp" in channels:
-            results["whatsapp"] = self.send_whatsapp_alert(message, record)
+        channel_results = {}
+        for channel, result in zip(selected, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error sending {channel} alert: {str(result)}")
+            channel_results[channel] = result is True
         
-        return results
+        return channel_results
+
+    async def send_custom_alert(self, message: str, channels: list, record: PPEComplianceRecord) -> Dict[str, bool]:
+        """Send custom alert to specified channels"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._dispatch_alerts(message, channels, record),
+            _get_alert_loop()
+        )
+        return await asyncio.wrap_future(future)
 
+    def send_alerts_sync(self, message: str, channels: list, record: PPEComplianceRecord) -> Dict[str, bool]:
+        """Blocking wrapper around send_custom_alert for synchronous callers"""
+        return run_sync(self._dispatch_alerts(message, channels, record))
 
+# Global alert service instance
+alert_service = AlertService()
@@ -1,152 +1,353 @@
+import asyncio
+from sqlalchemy import func, case, insert
 from sqlalchemy.orm import Session
-from models import PPEComplianceRecord, Worker, ComplianceAlert
+from sqlalchemy.dialects import postgresql, sqlite
+from models import PPEComplianceRecord, Worker, ComplianceAlert, SessionLocal, get_worker_by_worker_id
 from schemas import ComplianceCheckRequest, ComplianceCheckResponse, PPEDetectionResult
 from ppe_detector import ppe_detector
+from alert_service import alert_service, ALERT_CHANNELS
 from datetime import datetime
-import json
+from typing import Optional
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from cachetools import TTLCache
 import logging
+import json_utils
 
 logger = logging.getLogger(__name__)
 
+# Dialect-specific INSERT constructs that support ON CONFLICT DO NOTHING
+_UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert
+}
+
+# Worker fields needed to build compliance records, cached per process so
+# repeat checks for the same worker skip the database lookup
+WorkerSnapshot = namedtuple("WorkerSnapshot", ["worker_id", "name", "department", "shift"])
+
+_worker_cache = TTLCache(maxsize=10_000, ttl=300)
+_worker_cache_lock = Lock()
+
+def invalidate_worker_cache(worker_id: str):
+    """Drop a worker from the cache after its details change"""
+    with _worker_cache_lock:
+        _worker_cache.pop(worker_id, None)
+
+# Summary columns for worker history; skips the raw_detection_data blob
+_HISTORY_COLUMNS = (
+    PPEComplianceRecord.id,
+    PPEComplianceRecord.worker_id,
+    PPEComplianceRecord.worker_name,
+    PPEComplianceRecord.timestamp,
+    PPEComplianceRecord.helmet_detected,
+    PPEComplianceRecord.mask_detected,
+    PPEComplianceRecord.gloves_detected,
+    PPEComplianceRecord.jacket_detected,
+    PPEComplianceRecord.is_compliant,
+    PPEComplianceRecord.compliance_score,
+    PPEComplianceRecord.location,
+    PPEComplianceRecord.department,
+    PPEComplianceRecord.shift,
+    PPEComplianceRecord.alert_sent
+)
+
+# Concurrent checks are group-committed: whatever queued up while the previous
+# batch was being written goes out as one multi-row INSERT and one commit
+RECORD_BATCH_SIZE = 256
+
+# Batches are written one at a time on a dedicated thread, so the writer is
+# never starved by request handlers occupying the shared threadpool
+_record_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compliance-writer")
+
+# Alerts are sent off the request path; each job records its own outcome
+_alert_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="compliance-alerts")
+
+def _dispatch_compliance_alerts(record_id: int, message: str):
+    """Send alerts for a committed record and persist the channels used"""
+    db = SessionLocal()
+    try:
+        record = db.get(PPEComplianceRecord, record_id)
+        if record is None:
+            logger.warning(f"Compliance record {record_id} not found for alerting")
+            return
+        
+        # Send alerts to all configured channels concurrently
+        results = alert_service.send_alerts_sync(message, list(ALERT_CHANNELS), record)
+        channels_used = [channel for channel, sent in results.items() if sent]
+        
+        channels_json = json_utils.dumps(channels_used)
+        
+        # Create alert record
+        alert = ComplianceAlert(
+            record_id=record.id,
+            worker_id=record.worker_id,
+            alert_type="non_compliance",
+            message=message,
+            channels_sent=channels_json
+        )
+        
+        db.add(alert)
+        record.alert_sent = True
+        record.alert_channels = channels_json
+        db.commit()
+        
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error sending compliance alerts: {str(e)}")
+    finally:
+        db.close()
+
 class ComplianceService:
-    def __init__(self, db: Session):
-        self.db = db
+    """Compliance workflow shared by all requests; records are written in batches"""
+
+    def __init__(self):
+        # The queue and writer task belong to the event loop that created
+        # them and are rebuilt when the app runs on a new loop
+        self._record_loop = None
+        self._record_queue = None
+        self._record_writer = None
+
+    async def check_compliance(self, request: ComplianceCheckRequest,
+                               image_bytes: Optional[bytes] = None) -> ComplianceCheckResponse:
+        """Main compliance checking function (image_bytes: raw upload, used instead of the request's image)"""
+        # Perform PPE detection before any writes so the slow API call
+        # never runs inside the database transaction
+        detection_result = await self._perform_ppe_detection(request, image_bytes)
+        
+        return await self._queue_record(request, detection_result)
 
-    def check_compliance(self, request: ComplianceCheckRequest) -> ComplianceCheckResponse:
-        """Main compliance checking function"""
+    async def _queue_record(self, request: ComplianceCheckRequest,
+                            detection_result: PPEDetectionResult) -> ComplianceCheckResponse:
+        """Queue a detection result for the next record batch and wait for its response"""
+        loop = asyncio.get_running_loop()
+        if self._record_loop is not loop:
+            self._record_loop = loop
+            self._record_queue = asyncio.Queue()
+            self._record_writer = loop.create_task(self._run_record_writer(self._record_queue))
+        
+        future = loop.create_future()
+        await self._record_queue.put((request, detection_result, future))
+        return await future
+
+    async def aclose(self):
+        """Finish queued records and stop the writer (called on app shutdown)"""
+        if self._record_writer is None:
+            return
+        
+        queue, writer = self._record_queue, self._record_writer
+        self._record_loop = self._record_queue = self._record_writer = None
+        
+        await queue.join()
+        writer.cancel()
+        try:
+            await writer
+        except asyncio.CancelledError:
+            pass
+
+    async def _run_record_writer(self, queue: asyncio.Queue):
+        """Write queued records in batches without holding any request back"""
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < RECORD_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            # Database work is blocking, so keep it off the event loop
+            items = [(request, detection_result) for request, detection_result, _ in batch]
+            try:
+                responses = await self._write_records(items)
+            except Exception as e:
+                if len(batch) > 1:
+                    # Retry one by one so a single bad record fails alone
+                    logger.warning(f"Compliance batch of {len(batch)} failed, retrying individually: {str(e)}")
+                    responses = [await self._record_single(item) for item in items]
+                else:
+                    responses = [self._failure_response(e)]
+            
+            for (_, _, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+                queue.task_done()
+
+    async def _record_single(self, item: tuple) -> ComplianceCheckResponse:
+        """Write one record on its own after a failed batch"""
         try:
-            # Get or create worker
-            worker = self._get_or_create_worker(request)
+            return (await self._write_records([item]))[0]
+        except Exception as e:
+            return self._failure_response(e)
+
+    async def _write_records(self, items: list) -> list:
+        """Run a record batch on the writer thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_record_executor, self._record_compliance_batch, items)
+
+    def _failure_response(self, error: Exception) -> ComplianceCheckResponse:
+        """Response for a compliance check whose record could not be stored"""
+        logger.error(f"Error in compliance check: {str(error)}")
+        return ComplianceCheckResponse(
+            success=False,
+            message=f"Error during compliance check: {str(error)}"
+        )
+
+    def _record_compliance_batch(self, items: list) -> list:
+        """Store detection results with one INSERT and one commit, then queue alerts"""
+        db = SessionLocal()
+        try:
+            # Get or create workers (flushed only) and build the record rows
+            rows = [
+                self._compliance_record_values(request, detection_result, self._get_or_create_worker(db, request))
+                for request, detection_result in items
+            ]
             
-            # Perform PPE detection
-            detection_result = self._perform_ppe_detection(request)
+            record_ids = db.scalars(
+                insert(PPEComplianceRecord).returning(PPEComplianceRecord.id, sort_by_parameter_order=True),
+                rows
+            ).all()
             
-            # Create compliance record
-            record = self._create_compliance_record(request, detection_result, worker)
+            # Workers and records are written in a single transaction
+            db.commit()
             
+        except Exception:
+            db.rollback()
+            # Workers inserted in the rolled-back transaction must not stay cached
+            for request, _ in items:
+                invalidate_worker_cache(request.worker_id)
+            raise
+        finally:
+            db.close()
+        
+        responses = []
+        for (_, detection_result), row, record_id in zip(items, rows, record_ids):
             # Check if alerts need to be sent
             alert_sent = False
             if not detection_result.is_compliant:
-                alert_sent = self._send_compliance_alerts(record, detection_result)
+                alert_sent = self._send_compliance_alerts(
+                    record_id, self._create_alert_message(row, detection_result)
+                )
             
-            return ComplianceCheckResponse(
+            responses.append(ComplianceCheckResponse(
                 success=True,
                 message="Compliance check completed successfully",
                 data=detection_result,
-                record_id=record.id,
+                record_id=record_id,
                 alert_sent=alert_sent
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in compliance check: {str(e)}")
-            return ComplianceCheckResponse(
-                success=False,
-                message=f"Error during compliance check: {str(e)}"
-            )
-
-    def _get_or_create_worker(self, request: ComplianceCheckRequest) -> Worker:
-        """Get existing worker or create new one"""
-        worker = self.db.query(Worker).filter(Worker.worker_id == request.worker_id).first()
-        
-        if not worker:
-            worker = Worker(
-                worker_id=request.worker_id,
-                name=request.worker_name or "Unknown",
-                department=request.department or "Unknown",
-                shift=request.shift
-            )
-            self.db.add(worker)
-            self.db.commit()
-            self.db.refresh(worker)
+            ))
+        
+        return responses
+
+    def _get_or_create_worker(self, db: Session, request: ComplianceCheckRequest) -> WorkerSnapshot:
+        """Get existing worker or create new one (flushed, not committed)"""
+        with _worker_cache_lock:
+            cached = _worker_cache.get(request.worker_id)
+        if cached:
+            return cached
+        
+        worker = self._load_or_insert_worker(db, request)
+        snapshot = WorkerSnapshot(worker.worker_id, worker.name, worker.department, worker.shift)
+        
+        with _worker_cache_lock:
+            _worker_cache[request.worker_id] = snapshot
+        
+        return snapshot
+
+    def _load_or_insert_worker(self, db: Session, request: ComplianceCheckRequest) -> Worker:
+        """Look up the worker row, inserting it if missing"""
+        worker = get_worker_by_worker_id(db, request.worker_id)
+        if worker:
+            return worker
+        
+        values = {
+            "worker_id": request.worker_id,
+            "name": request.worker_name or "Unknown",
+            "department": request.department or "Unknown",
+            "shift": request.shift
+        }
+        
+        dialect_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        if dialect_insert is None:
+            worker = Worker(**values)
+            db.add(worker)
+            db.flush()
+            return worker
+        
+        # Single INSERT ... ON CONFLICT DO NOTHING RETURNING round trip
+        stmt = dialect_insert(Worker)\
+            .values(**values)\
+            .on_conflict_do_nothing(index_elements=["worker_id"])\
+            .returning(Worker)
+        worker = db.scalars(stmt).first()
+        
+        if worker is None:
+            # Worker was inserted concurrently by another request
+            worker = get_worker_by_worker_id(db, request.worker_id)
         
         return worker
 
-    def _perform_ppe_detection(self, request: ComplianceCheckRequest) -> PPEDetectionResult:
+    async def _perform_ppe_detection(self, request: ComplianceCheckRequest,
+                                     image_bytes: Optional[bytes] = None) -> PPEDetectionResult:
         """Perform PPE detection based on input type"""
-        if request.image_url:
-            return ppe_detector.detect_ppe_from_url(request.image_url)
+        if image_bytes:
+            return await ppe_detector.detect_ppe_from_bytes(image_bytes)
+        elif request.image_url:
+            return await ppe_detector.detect_ppe_from_url(request.image_url)
         elif request.image_base64:
-            return ppe_detector.detect_ppe_from_base64(request.image_base64)
+            return await ppe_detector.detect_ppe_from_base64(request.image_base64)
         else:
             logger.warning("No image provided for PPE detection")
             return PPEDetectionResult()
 
-    def _create_compliance_record(self, request: ComplianceCheckRequest, 
-                                detection_result: PPEDetectionResult, worker: Worker) -> PPEComplianceRecord:
-        """Create a new compliance record in the database"""
-        record = PPEComplianceRecord(
-            worker_id=request.worker_id,
-            worker_name=worker.name,
-            helmet_detected=detection_result.helmet_detected,
-            mask_detected=detection_result.mask_detected,
-            gloves_detected=detection_result.gloves_detected,
-            jacket_detected=detection_result.jacket_detected,
-            helmet_confidence=detection_result.helmet_confidence,
-            mask_confidence=detection_result.mask_confidence,
-            gloves_confidence=detection_result.gloves_confidence,
-            jacket_confidence=detection_result.jacket_confidence,
-            is_compliant=detection_result.is_compliant,
-            compliance_score=detection_result.compliance_score,
-            location=request.location,
-            department=request.department or worker.department,
-            shift=request.shift or worker.shift,
-            raw_detection_data=json.dumps(ppe_detector.get_detection_summary(detection_result))
-        )
-        
-        self.db.add(record)
-        self.db.commit()
-        self.db.refresh(record)
-        
-        return record
+    def _compliance_record_values(self, request: ComplianceCheckRequest,
+                                  detection_result: PPEDetectionResult, worker: WorkerSnapshot) -> dict:
+        """Column values for a new compliance record"""
+        return {
+            "worker_id": request.worker_id,
+            "worker_name": worker.name,
+            "timestamp": datetime.utcnow(),
+            "helmet_detected": detection_result.helmet_detected,
+            "mask_detected": detection_result.mask_detected,
+            "gloves_detected": detection_result.gloves_detected,
+            "jacket_detected": detection_result.jacket_detected,
+            "helmet_confidence": detection_result.helmet_confidence,
+            "mask_confidence": detection_result.mask_confidence,
+            "gloves_confidence": detection_result.gloves_confidence,
+            "jacket_confidence": detection_result.jacket_confidence,
+            "is_compliant": detection_result.is_compliant,
+            "compliance_score": detection_result.compliance_score,
+            "location": request.location,
+            "department": request.department or worker.department,
+            "shift": request.shift or worker.shift,
+            "raw_detection_data": json_utils.dumps(ppe_detector.get_detection_summary(detection_result))
+        }
 
-    def _send_compliance_alerts(self, record: PPEComplianceRecord, 
-                              detection_result: PPEDetectionResult) -> bool:
-        """Send alerts for non-compliance"""
+    def _create_alert_message(self, record: dict, 
+                              detection_result: PPEDetectionResult) -> str:
+        """Create the non-compliance alert message from a record's column values"""
+        missing_items = ppe_detector._get_missing_items(detection_result)
+        message = f"PPE Non-Compliance Alert for {record['worker_name']} (ID: {record['worker_id']})\n"
+        message += f"Missing PPE: {', '.join(missing_items)}\n"
+        message += f"Compliance Score: {detection_result.compliance_score:.1f}%\n"
+        message += f"Location: {record['location'] or 'Unknown'}\n"
+        message += f"Time: {record['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}"
+        return message
+
+    def _send_compliance_alerts(self, record_id: int, message: str) -> bool:
+        """Queue alerts for a committed non-compliant record
+        
+        Returns True when alerts were queued for at least one configured channel;
+        delivery happens later and the channels reached are stored on the record.
+        """
         try:
-            from alert_service import AlertService
-            alert_service = AlertService()
-            
-            missing_items = ppe_detector._get_missing_items(detection_result)
-            message = f"PPE Non-Compliance Alert for {record.worker_name} (ID: {record.worker_id})\n"
-            message += f"Missing PPE: {', '.join(missing_items)}\n"
-            message += f"Compliance Score: {detection_result.compliance_score:.1f}%\n"
-            message += f"Location: {record.location or 'Unknown'}\n"
-            message += f"Time: {record.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
-            
-            # Send alerts to all configured channels
-            channels_used = []
-            if alert_service.send_slack_alert(message, record):
-                channels_used.append("slack")
-            
-            if alert_service.send_email_alert(message, record):
-                channels_used.append("email")
-            
-            if alert_service.send_whatsapp_alert(message, record):
-                channels_used.append("whatsapp")
-            
-            # Create alert record
-            alert = ComplianceAlert(
-                record_id=record.id,
-                worker_id=record.worker_id,
-                alert_type="non_compliance",
-                message=message,
-                channels_sent=json.dumps(channels_used)
-            )
-            
-            self.db.add(alert)
-            record.alert_sent = True
-            record.alert_channels = json.dumps(channels_used)
-            self.db.commit()
-            
-            return len(channels_used) > 0
+            _alert_executor.submit(_dispatch_compliance_alerts, record_id, message)
+            return bool(alert_service.configured_channels())
             
         except Exception as e:
-            logger.error(f"Error sending compliance alerts: {str(e)}")
+            logger.error(f"Error queueing compliance alerts: {str(e)}")
             return False
 
-    def get_worker_compliance_history(self, worker_id: str, limit: int = 10) -> list:
-        """Get compliance history for a specific worker"""
-        records = self.db.query(PPEComplianceRecord)\
+    def get_worker_compliance_history(self, db: Session, worker_id: str, limit: int = 10) -> list:
+        """Get compliance history for a specific worker (summary columns only)"""
+        records = db.query(*_HISTORY_COLUMNS)\
             .filter(PPEComplianceRecord.worker_id == worker_id)\
             .order_by(PPEComplianceRecord.timestamp.desc())\
             .limit(limit)\
@@ -154,18 +355,19 @@ class ComplianceService:
         
         return records
 
-    def get_department_compliance_stats(self, department: str, days: int = 7) -> dict:
+    def get_department_compliance_stats(self, db: Session, department: str, days: int = 7) -> dict:
         """Get compliance statistics for a department"""
         from datetime import timedelta
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        records = self.db.query(PPEComplianceRecord)\
-            .filter(PPEComplianceRecord.department == department)\
+        total_checks, compliant_checks = db.query(
+            func.count(PPEComplianceRecord.id),
+            func.sum(case((PPEComplianceRecord.is_compliant, 1), else_=0))
+        ).filter(PPEComplianceRecord.department == department)\
             .filter(PPEComplianceRecord.timestamp >= start_date)\
-            .all()
+            .one()
         
-        total_checks = len(records)
-        compliant_checks = len([r for r in records if r.is_compliant])
+        compliant_checks = compliant_checks or 0
         non_compliant_checks = total_checks - compliant_checks
         
         compliance_rate = (compliant_checks / total_checks * 100) if total_checks > 0 else 0
@@ -179,30 +381,28 @@ class ComplianceService:
             'period_days': days
         }
 
-    def get_overall_compliance_stats(self, days: int = 7) -> dict:
+    def get_overall_compliance_stats(self, db: Session, days: int = 7) -> dict:
         """Get overall compliance statistics"""
         from datetime import timedelta
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        records = self.db.query(PPEComplianceRecord)\
-            .filter(PPEComplianceRecord.timestamp >= start_date)\
+        # Per-department counts aggregated in the database
+        rows = db.query(
+            PPEComplianceRecord.department,
+            func.count(PPEComplianceRecord.id),
+            func.sum(case((PPEComplianceRecord.is_compliant, 1), else_=0))
+        ).filter(PPEComplianceRecord.timestamp >= start_date)\
+            .group_by(PPEComplianceRecord.department)\
             .all()
         
-        total_checks = len(records)
-        compliant_checks = len([r for r in records if r.is_compliant])
-        non_compliant_checks = total_checks - compliant_checks
-        
-        compliance_rate = (compliant_checks / total_checks * 100) if total_checks > 0 else 0
-        
         # Department breakdown
         departments = {}
-        for record in records:
-            dept = record.department or 'Unknown'
+        for department, total, compliant in rows:
+            dept = department or 'Unknown'
             if dept not in departments:
                 departments[dept] = {'total': 0, 'compliant': 0}
-            departments[dept]['total'] += 1
-            if record.is_compliant:
-                departments[dept]['compliant'] += 1
+            departments[dept]['total'] += total
+            departments[dept]['compliant'] += compliant or 0
         
         # Calculate department rates
         for dept in departments:
@@ -210,6 +410,12 @@ class ComplianceService:
             compliant = departments[dept]['compliant']
             departments[dept]['rate'] = (compliant / total * 100) if total > 0 else 0
         
+        total_checks = sum(dept['total'] for dept in departments.values())
+        compliant_checks = sum(dept['compliant'] for dept in departments.values())
+        non_compliant_checks = total_checks - compliant_checks
+        
+        compliance_rate = (compliant_checks / total_checks * 100) if total_checks > 0 else 0
+        
         return {
             'total_checks': total_checks,
             'compliant_checks': compliant_checks,
@@ -219,4 +425,9 @@ class ComplianceService:
             'period_days': days
         }
 
+# Global compliance service instance
+compliance_service = ComplianceService()
 
+def get_compliance_service() -> ComplianceService:
+    """FastAPI dependency returning the shared compliance service"""
+    return compliance_service
@@ -1,49 +1,76 @@
 import os
+from dataclasses import dataclass
+from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv()
 
+@dataclass(frozen=True)
 class Settings:
     # Roboflow API Configuration
-    ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY", "")
-    ROBOFLOW_PROJECT_ID = os.getenv("ROBOFLOW_PROJECT_ID", "")
-    ROBOFLOW_MODEL_VERSION = os.getenv("ROBOFLOW_MODEL_VERSION", "1")
+    ROBOFLOW_API_KEY: str = os.getenv("ROBOFLOW_API_KEY", "")
+    ROBOFLOW_PROJECT_ID: str = os.getenv("ROBOFLOW_PROJECT_ID", "")
+    ROBOFLOW_MODEL_VERSION: str = os.getenv("ROBOFLOW_MODEL_VERSION", "1")
     
     # Database Configuration
-    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ppe_compliance.db")
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./ppe_compliance.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "100"))
+    # Create missing tables when the app starts; disable in production and
+    # run `python run.py --init-db` as a deploy step instead
+    AUTO_CREATE_TABLES: bool = os.getenv("AUTO_CREATE_TABLES", "True").lower() == "true"
     
     # Google Sheets Configuration
-    GOOGLE_SHEETS_CREDENTIALS_FILE = os.getenv("GOOGLE_SHEETS_CREDENTIALS_FILE", "credentials.json")
-    GOOGLE_SHEETS_SPREADSHEET_ID = os.getenv("GOOGLE_SHEETS_SPREADSHEET_ID", "")
+    GOOGLE_SHEETS_CREDENTIALS_FILE: str = os.getenv("GOOGLE_SHEETS_CREDENTIALS_FILE", "credentials.json")
+    GOOGLE_SHEETS_SPREADSHEET_ID: str = os.getenv("GOOGLE_SHEETS_SPREADSHEET_ID", "")
     
     # Airtable Configuration
-    AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY", "")
-    AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID", "")
-    AIRTABLE_TABLE_NAME = os.getenv("AIRTABLE_TABLE_NAME", "PPE_Compliance")
+    AIRTABLE_API_KEY: str = os.getenv("AIRTABLE_API_KEY", "")
+    AIRTABLE_BASE_ID: str = os.getenv("AIRTABLE_BASE_ID", "")
+    AIRTABLE_TABLE_NAME: str = os.getenv("AIRTABLE_TABLE_NAME", "PPE_Compliance")
+    
+    # Threads used to write to Google Sheets and Airtable concurrently
+    WRITER_POOL_SIZE: int = int(os.getenv("WRITER_POOL_SIZE", "4"))
+    
+    # Request rate limits for external storage (requests per second, 0 disables)
+    SHEETS_QPS: float = float(os.getenv("SHEETS_QPS", "1.0"))
+    AIRTABLE_QPS: float = float(os.getenv("AIRTABLE_QPS", "5.0"))
+    
+    # Largest accepted image upload (bytes)
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
     
     # Slack Configuration
-    SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN", "")
-    SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID", "")
+    SLACK_BOT_TOKEN: str = os.getenv("SLACK_BOT_TOKEN", "")
+    SLACK_CHANNEL_ID: str = os.getenv("SLACK_CHANNEL_ID", "")
     
     # WhatsApp Configuration (Twilio)
-    TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
-    TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
-    TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER", "whatsapp:+14155238886")
+    TWILIO_ACCOUNT_SID: str = os.getenv("TWILIO_ACCOUNT_SID", "")
+    TWILIO_AUTH_TOKEN: str = os.getenv("TWILIO_AUTH_TOKEN", "")
+    TWILIO_WHATSAPP_NUMBER: str = os.getenv("TWILIO_WHATSAPP_NUMBER", "whatsapp:+14155238886")
     
     # Email Configuration (SendGrid)
-    SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "")
-    FROM_EMAIL = os.getenv("FROM_EMAIL", "safety@yourcompany.com")
+    SENDGRID_API_KEY: str = os.getenv("SENDGRID_API_KEY", "")
+    FROM_EMAIL: str = os.getenv("FROM_EMAIL", "safety@yourcompany.com")
+    
+    # Open keep-alive connections to configured alert providers at startup
+    WARM_CONNECTIONS: bool = os.getenv("WARM_CONNECTIONS", "True").lower() == "true"
     
     # Security
-    SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
-    ALGORITHM = os.getenv("ALGORITHM", "HS256")
-    ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
+    ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
     # Server Configuration
-    HOST = os.getenv("HOST", "0.0.0.0")
-    PORT = int(os.getenv("PORT", "8000"))
-    DEBUG = os.getenv("DEBUG", "True").lower() == "true"
+    HOST: str = os.getenv("HOST", "0.0.0.0")
+    PORT: int = int(os.getenv("PORT", "8000"))
+    DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Parse settings once; the frozen instance is safe to cache and share"""
+    return Settings()
 
-settings = Settings()
+settings = get_settings()
 
 
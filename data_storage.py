@@ -1,14 +1,32 @@
+import asyncio
+import atexit
+import csv
+import io
 import json
 import logging
-from typing import Dict, List, Optional, Any
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Any
 from datetime import datetime
+from functools import cached_property
+from operator import attrgetter
+import aiohttp
+from cachetools import LRUCache
 from config import settings
-from models import PPEComplianceRecord, Worker
+import json_utils
+from sqlalchemy import select
+from sqlalchemy.orm import undefer
+from models import PPEComplianceRecord, Worker, SessionLocal
+import numpy as np
 import pandas as pd
 
 # Google Sheets integration
 try:
+    import httplib2
     from google.oauth2.service_account import Credentials
+    from google_auth_httplib2 import AuthorizedHttp
     from googleapiclient.discovery import build
     GOOGLE_SHEETS_AVAILABLE = True
 except ImportError:
@@ -17,24 +35,271 @@ except ImportError:
 # Airtable integration
 try:
     from airtable import Airtable
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
     AIRTABLE_AVAILABLE = True
 except ImportError:
     AIRTABLE_AVAILABLE = False
 
+# Excel export (write-only mode streams rows instead of building a DataFrame)
+try:
+    from openpyxl import Workbook
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+# Parquet export
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+if AIRTABLE_AVAILABLE:
+    class _Airtable(Airtable):
+        """Airtable client that encodes request bodies with json_utils (orjson when installed)"""
+        
+        rate_limiter = None
+        
+        def _request(self, method, url, params=None, json_data=None):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            data = json_utils.dumps_bytes(json_data) if json_data is not None else None
+            response = self.session.request(
+                method, url, params=params, data=data, timeout=self.timeout,
+                headers={'Content-Type': 'application/json'} if data is not None else None
+            )
+            return self._process_response(response)
+
+# Report columns and the record attribute each one is read from
+_EXPORT_COLUMNS = (
+    ('Timestamp', 'timestamp'),
+    ('Worker ID', 'worker_id'),
+    ('Worker Name', 'worker_name'),
+    ('Department', 'department'),
+    ('Location', 'location'),
+    ('Shift', 'shift'),
+    ('Helmet Detected', 'helmet_detected'),
+    ('Helmet Confidence', 'helmet_confidence'),
+    ('Mask Detected', 'mask_detected'),
+    ('Mask Confidence', 'mask_confidence'),
+    ('Gloves Detected', 'gloves_detected'),
+    ('Gloves Confidence', 'gloves_confidence'),
+    ('Jacket Detected', 'jacket_detected'),
+    ('Jacket Confidence', 'jacket_confidence'),
+    ('Is Compliant', 'is_compliant'),
+    ('Compliance Score', 'compliance_score'),
+    ('Alert Sent', 'alert_sent'),
+    ('Alert Channels', 'alert_channels'),
+    ('Notes', 'notes')
+)
+_EXPORT_HEADERS = [header for header, _ in _EXPORT_COLUMNS]
+_export_row = attrgetter(*(attr for _, attr in _EXPORT_COLUMNS))
+
+def _json_export_row(record: PPEComplianceRecord) -> Dict[str, Any]:
+    """Report row for JSON export, with the timestamp in pandas' ISO format (ms + 'Z')"""
+    row = dict(zip(_EXPORT_HEADERS, _export_row(record)))
+    timestamp = record.timestamp
+    if timestamp is not None:
+        row['Timestamp'] = f"{timestamp:%Y-%m-%dT%H:%M:%S}.{timestamp.microsecond // 1000:03d}Z"
+    return row
+
+# Deferred record columns written to Sheets/Airtable and file exports; load
+# them with the record whenever it may outlive its session
+EXTERNAL_RECORD_OPTIONS = (
+    undefer(PPEComplianceRecord.alert_channels),
+    undefer(PPEComplianceRecord.notes)
+)
+# The same columns as a Core select, for streaming exports without ORM hydration
+_EXPORT_SELECT = select(*(getattr(PPEComplianceRecord, attr) for _, attr in _EXPORT_COLUMNS))
+EXPORT_STREAM_BATCH = 1000
+
+# Column types for Parquet export: float32 scores and plain booleans
+_PARQUET_DTYPES = {header: 'float32' for header in _EXPORT_HEADERS if header.endswith(('Confidence', 'Score'))}
+_PARQUET_DTYPES.update(
+    (header, 'bool') for header in _EXPORT_HEADERS
+    if header.endswith('Detected') or header in ('Is Compliant', 'Alert Sent')
+)
+
+# Expression used to render each kind of value, with {0} standing for the attribute
+_VALUE_EXPRESSIONS = {
+    'raw': "r.{0}",
+    'text': "(r.{0} or '')",
+    'yes_no': "('Yes' if r.{0} else 'No')",
+    'fixed2': "f'{{r.{0}:.2f}}'",
+    'datetime': "r.{0}.isoformat(sep=' ', timespec='seconds')",
+    'iso': "r.{0}.isoformat()"
+}
+
+# Google Sheets columns (A:S) as (attribute, kind)
+_SHEETS_COLUMNS = (
+    ('timestamp', 'datetime'),
+    ('worker_id', 'raw'),
+    ('worker_name', 'text'),
+    ('department', 'text'),
+    ('location', 'text'),
+    ('shift', 'text'),
+    ('helmet_detected', 'yes_no'),
+    ('helmet_confidence', 'fixed2'),
+    ('mask_detected', 'yes_no'),
+    ('mask_confidence', 'fixed2'),
+    ('gloves_detected', 'yes_no'),
+    ('gloves_confidence', 'fixed2'),
+    ('jacket_detected', 'yes_no'),
+    ('jacket_confidence', 'fixed2'),
+    ('is_compliant', 'yes_no'),
+    ('compliance_score', 'fixed2'),
+    ('alert_sent', 'yes_no'),
+    ('alert_channels', 'text'),
+    ('notes', 'text')
+)
+
+# Airtable fields as (field name, attribute, kind)
+_AIRTABLE_COLUMNS = (
+    ('Worker ID', 'worker_id', 'raw'),
+    ('Worker Name', 'worker_name', 'text'),
+    ('Timestamp', 'timestamp', 'iso'),
+    ('Department', 'department', 'text'),
+    ('Location', 'location', 'text'),
+    ('Shift', 'shift', 'text'),
+    ('Helmet Detected', 'helmet_detected', 'raw'),
+    ('Helmet Confidence', 'helmet_confidence', 'raw'),
+    ('Mask Detected', 'mask_detected', 'raw'),
+    ('Mask Confidence', 'mask_confidence', 'raw'),
+    ('Gloves Detected', 'gloves_detected', 'raw'),
+    ('Gloves Confidence', 'gloves_confidence', 'raw'),
+    ('Jacket Detected', 'jacket_detected', 'raw'),
+    ('Jacket Confidence', 'jacket_confidence', 'raw'),
+    ('Is Compliant', 'is_compliant', 'raw'),
+    ('Compliance Score', 'compliance_score', 'raw'),
+    ('Alert Sent', 'alert_sent', 'raw'),
+    ('Alert Channels', 'alert_channels', 'text'),
+    ('Notes', 'notes', 'text')
+)
+
+# The schemas are fixed, so each builder is generated once as a single
+# list/dict literal instead of being assembled value by value per record
+_sheets_row = eval(
+    "lambda r: [" + ", ".join(_VALUE_EXPRESSIONS[kind].format(attr) for attr, kind in _SHEETS_COLUMNS) + "]"
+)
+_airtable_record_fields = eval(
+    "lambda r: {" + ", ".join(
+        f"{name!r}: " + _VALUE_EXPRESSIONS[kind].format(attr) for name, attr, kind in _AIRTABLE_COLUMNS
+    ) + "}"
+)
+
+# Compliance records are queued and written by a background thread in batches
+# of up to WRITE_BATCH_SIZE, waiting at most WRITE_FLUSH_INTERVAL seconds to fill one
+WRITE_QUEUE_SIZE = 10_000
+WRITE_BATCH_SIZE = 100
+WRITE_FLUSH_INTERVAL = 1.0
+
+# Airtable worker id -> record id map is reused between syncs for this long (seconds)
+AIRTABLE_ID_CACHE_TTL = 300
+
+# Airtable accepts at most 10 records per create/update request; batches are sent
+# concurrently over at most AIRTABLE_CONCURRENCY connections
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_CONCURRENCY = 5
+AIRTABLE_TIMEOUT = 30
+
+# Rate-limited (429) or failed (5xx) batch requests are retried with backoff;
+# a 429 locks the base out for 30 seconds, so wait that out before retrying
+AIRTABLE_MAX_ATTEMPTS = 3
+AIRTABLE_RETRY_BACKOFF = 0.5
+AIRTABLE_LOCKOUT = 30
+
+# Worker IDs per filterByFormula lookup, keeping each lookup to a single page
+AIRTABLE_FORMULA_CHUNK = 95
+
+# IDs of recently written records, so a duplicate is skipped even if it lands in a later batch
+RECENT_WRITE_KEYS = 1024
+
+# Queue sentinel that stops the writer thread
+_STOP = object()
+
+class TokenBucket:
+    """Space out calls to at most `rate` per second, allowing bursts of up to `rate` calls"""
+    
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self) -> float:
+        """Take a token and return how long the caller must wait for it"""
+        if self.rate <= 0:
+            return 0.0
+        
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+    
+    def acquire(self):
+        """Block until a call is allowed"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a call is allowed"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
 class DataStorageService:
     def __init__(self):
-        self.google_sheets_service = None
-        self.airtable_service = None
+        # Google Sheets and Airtable clients are built on first use (see the
+        # cached properties below) so importing this module does no network I/O
+        self._workers_sheet_id = None
+        self._airtable_id_cache = None
         
-        # Initialize Google Sheets
-        if GOOGLE_SHEETS_AVAILABLE and settings.GOOGLE_SHEETS_CREDENTIALS_FILE:
-            self._init_google_sheets()
+        # IDs of recently written records; only touched by the writer thread
+        self._recent_writes = LRUCache(maxsize=RECENT_WRITE_KEYS)
+        self._write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.WRITER_POOL_SIZE or 4,
+            thread_name_prefix="storage-io"
+        )
+        
+        # httplib2 connections are not thread-safe; serialize Sheets calls
+        self._sheets_lock = threading.Lock()
+        
+        # Stay under the Sheets (60 writes/min) and Airtable (5 req/s) quotas
+        # instead of tripping 429s and retrying
+        self._sheets_bucket = TokenBucket(settings.SHEETS_QPS)
+        self._airtable_bucket = TokenBucket(settings.AIRTABLE_QPS)
         
-        # Initialize Airtable
+        # Airtable batches run on one long-lived event loop thread so a single
+        # pooled aiohttp session keeps its connections between flushes
+        self._airtable_loop = None
+        self._airtable_session = None
+        self._airtable_loop_lock = threading.Lock()
+        
+        atexit.register(self.close)
+
+    @cached_property
+    def google_sheets_service(self):
+        """Google Sheets service, initialized on first access"""
+        if GOOGLE_SHEETS_AVAILABLE and settings.GOOGLE_SHEETS_CREDENTIALS_FILE:
+            return self._init_google_sheets()
+        return None
+
+    @cached_property
+    def airtable_service(self):
+        """Airtable client, initialized on first access"""
         if AIRTABLE_AVAILABLE and settings.AIRTABLE_API_KEY:
-            self._init_airtable()
+            return self._init_airtable()
+        return None
 
     def _init_google_sheets(self):
         """Initialize Google Sheets service"""
@@ -44,117 +309,255 @@ class DataStorageService:
                 settings.GOOGLE_SHEETS_CREDENTIALS_FILE, 
                 scopes=scopes
             )
-            self.google_sheets_service = build('sheets', 'v4', credentials=credentials)
+            # Reuse one keep-alive connection instead of a new TLS handshake per call
+            http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=10))
+            
+            # Use the discovery document bundled with google-api-python-client
+            # instead of fetching it over the network
+            service = build('sheets', 'v4', http=http, cache_discovery=False, static_discovery=True)
             logger.info("Google Sheets service initialized successfully")
+            return service
         except Exception as e:
             logger.error(f"Failed to initialize Google Sheets: {str(e)}")
+            return None
 
     def _init_airtable(self):
         """Initialize Airtable service"""
         try:
-            self.airtable_service = Airtable(
+            airtable = _Airtable(
                 settings.AIRTABLE_BASE_ID,
                 settings.AIRTABLE_TABLE_NAME,
                 settings.AIRTABLE_API_KEY
             )
+            airtable.rate_limiter = self._airtable_bucket
+            
+            # Pool keep-alive connections on the wrapper's requests session and
+            # retry rate-limited or failed idempotent calls with backoff
+            adapter = HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=20,
+                max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+            )
+            airtable.session.mount('https://', adapter)
             logger.info("Airtable service initialized successfully")
+            return airtable
         except Exception as e:
             logger.error(f"Failed to initialize Airtable: {str(e)}")
+            return None
+
+    def _ensure_writer(self):
+        """Start the background writer thread on first use"""
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._flush_loop, name="storage-writer", daemon=True)
+                self._writer.start()
 
     def log_compliance_record(self, record: PPEComplianceRecord) -> Dict[str, bool]:
-        """Log compliance record to external storage systems"""
+        """Queue compliance record for logging to external storage systems"""
         results = {}
+        if not (self.google_sheets_service or self.airtable_service):
+            return results
+        
+        self._ensure_writer()
+        try:
+            # Snapshot the record now; the writer thread never touches the ORM object
+            self._write_queue.put_nowait(self._prepare_entry(record))
+            queued = True
+        except queue.Full:
+            logger.error("Storage write queue is full, dropping compliance record")
+            queued = False
+        except Exception as e:
+            logger.error(f"Error queueing compliance record: {str(e)}")
+            queued = False
+        
+        if self.google_sheets_service:
+            results['google_sheets'] = queued
+        if self.airtable_service:
+            results['airtable'] = queued
+        
+        return results
+
+    def log_compliance_record_by_id(self, record_id: int) -> Dict[str, bool]:
+        """Load a committed record and queue it for external storage (for background tasks)"""
+        if not (self.google_sheets_service or self.airtable_service):
+            return {}
+        
+        db = SessionLocal()
+        try:
+            record = db.get(PPEComplianceRecord, record_id, options=EXTERNAL_RECORD_OPTIONS)
+            if record is None:
+                logger.warning(f"Compliance record {record_id} not found for external logging")
+                return {}
+            return self.log_compliance_record(record)
+        finally:
+            db.close()
+
+    def log_compliance_records(self, records: List[PPEComplianceRecord]) -> Dict[str, bool]:
+        """Log many compliance records to external storage systems in bulk"""
+        results = {}
+        if not records:
+            return results
+        
+        futures = {}
         
         # Log to Google Sheets
         if self.google_sheets_service:
-            results['google_sheets'] = self._log_to_google_sheets(record)
+            futures['google_sheets'] = self._executor.submit(
+                self._log_to_google_sheets_bulk,
+                [_sheets_row(record) for record in records]
+            )
         
         # Log to Airtable
         if self.airtable_service:
-            results['airtable'] = self._log_to_airtable(record)
+            futures['airtable'] = self._executor.submit(
+                self._log_to_airtable_bulk,
+                [_airtable_record_fields(record) for record in records]
+            )
         
-        return results
+        return {name: future.result() for name, future in futures.items()}
 
-    def _log_to_google_sheets(self, record: PPEComplianceRecord) -> bool:
-        """Log compliance record to Google Sheets"""
-        try:
-            # Prepare data row
-            row_data = [
-                record.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                record.worker_id,
-                record.worker_name or '',
-                record.department or '',
-                record.location or '',
-                record.shift or '',
-                'Yes' if record.helmet_detected else 'No',
-                f"{record.helmet_confidence:.2f}",
-                'Yes' if record.mask_detected else 'No',
-                f"{record.mask_confidence:.2f}",
-                'Yes' if record.gloves_detected else 'No',
-                f"{record.gloves_confidence:.2f}",
-                'Yes' if record.jacket_detected else 'No',
-                f"{record.jacket_confidence:.2f}",
-                'Yes' if record.is_compliant else 'No',
-                f"{record.compliance_score:.2f}",
-                'Yes' if record.alert_sent else 'No',
-                record.alert_channels or '',
-                record.notes or ''
-            ]
+    def _prepare_entry(self, record: PPEComplianceRecord) -> tuple:
+        """Snapshot the record ID, Google Sheets row and Airtable fields for a queued record"""
+        return (
+            record.id,
+            _sheets_row(record) if self.google_sheets_service else None,
+            _airtable_record_fields(record) if self.airtable_service else None
+        )
+
+    def _flush_loop(self):
+        """Drain the write queue in batches (runs on the storage-writer thread)"""
+        while True:
+            entry = self._write_queue.get()
+            if entry is _STOP:
+                self._write_queue.task_done()
+                return
+            
+            batch = [entry]
+            stopping = False
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._write_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Error writing storage batch: {str(e)}")
+            finally:
+                for _ in range(len(batch) + stopping):
+                    self._write_queue.task_done()
             
-            # Append to sheet
+            if stopping:
+                return
+
+    def _write_batch(self, batch: List[tuple]):
+        """Write one batch of queued entries to every configured system in parallel"""
+        # A record queued more than once (e.g. a retried background task) is
+        # written once; unsaved records have no ID and are always written
+        entries = []
+        for record_id, row, fields in batch:
+            if record_id is not None:
+                if record_id in self._recent_writes:
+                    continue
+                self._recent_writes[record_id] = True
+            entries.append((row, fields))
+        
+        futures = []
+        
+        rows = [row for row, _ in entries if row is not None]
+        if rows:
+            futures.append(self._executor.submit(self._log_to_google_sheets_bulk, rows))
+        
+        airtable_rows = [fields for _, fields in entries if fields is not None]
+        if airtable_rows:
+            futures.append(self._executor.submit(self._log_to_airtable_bulk, airtable_rows))
+        
+        for future in futures:
+            future.result()
+
+    def flush(self):
+        """Block until every queued record has been written"""
+        if self._writer and self._writer.is_alive():
+            self._write_queue.join()
+
+    def close(self):
+        """Write out queued records, then stop the writer thread and the Airtable loop"""
+        if self._writer and self._writer.is_alive():
+            self._write_queue.put(_STOP)
+            self._writer.join(timeout=30)
+        
+        with self._airtable_loop_lock:
+            loop, session = self._airtable_loop, self._airtable_session
+            self._airtable_loop = self._airtable_session = None
+        if loop is None:
+            return
+        
+        try:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+        except Exception as e:
+            logger.error(f"Error closing Airtable HTTP session: {str(e)}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+
+    def _log_to_google_sheets_bulk(self, rows: List[List[str]]) -> bool:
+        """Append many rows to Google Sheets in a single request"""
+        try:
             body = {
-                'values': [row_data]
+                'values': rows
             }
             
-            result = self.google_sheets_service.spreadsheets().values().append(
-                spreadsheetId=settings.GOOGLE_SHEETS_SPREADSHEET_ID,
-                range='Sheet1!A:S',  # Adjust range as needed
-                valueInputOption='RAW',
-                body=body
-            ).execute()
+            result = self._execute_sheets(
+                self.google_sheets_service.spreadsheets().values().append(
+                    spreadsheetId=settings.GOOGLE_SHEETS_SPREADSHEET_ID,
+                    range='Sheet1!A:S',  # Adjust range as needed
+                    valueInputOption='RAW',
+                    body=body
+                )
+            )
             
-            logger.info(f"Record logged to Google Sheets: {result.get('updates', {}).get('updatedRows', 0)} rows updated")
+            logger.info(f"Records logged to Google Sheets: {result.get('updates', {}).get('updatedRows', 0)} rows updated")
             return True
             
         except Exception as e:
             logger.error(f"Error logging to Google Sheets: {str(e)}")
             return False
 
-    def _log_to_airtable(self, record: PPEComplianceRecord) -> bool:
-        """Log compliance record to Airtable"""
+    def _execute_sheets(self, request):
+        """Execute a Sheets API request within the rate limit, one at a time"""
+        self._sheets_bucket.acquire()
+        with self._sheets_lock:
+            return request.execute()
+
+    def _log_to_airtable_bulk(self, rows: List[Dict[str, Any]]) -> bool:
+        """Log prepared compliance records to Airtable, 10 records per request"""
         try:
-            # Prepare data for Airtable
-            airtable_data = {
-                'Worker ID': record.worker_id,
-                'Worker Name': record.worker_name or '',
-                'Timestamp': record.timestamp.isoformat(),
-                'Department': record.department or '',
-                'Location': record.location or '',
-                'Shift': record.shift or '',
-                'Helmet Detected': record.helmet_detected,
-                'Helmet Confidence': record.helmet_confidence,
-                'Mask Detected': record.mask_detected,
-                'Mask Confidence': record.mask_confidence,
-                'Gloves Detected': record.gloves_detected,
-                'Gloves Confidence': record.gloves_confidence,
-                'Jacket Detected': record.jacket_detected,
-                'Jacket Confidence': record.jacket_confidence,
-                'Is Compliant': record.is_compliant,
-                'Compliance Score': record.compliance_score,
-                'Alert Sent': record.alert_sent,
-                'Alert Channels': record.alert_channels or '',
-                'Notes': record.notes or ''
-            }
-            
-            # Insert record
-            result = self.airtable_service.insert(airtable_data)
-            logger.info(f"Record logged to Airtable: {result.get('id', 'unknown')}")
-            return True
+            inserted, failed = self._airtable_batch('POST', [{'fields': fields} for fields in rows])
+            logger.info(f"Records logged to Airtable: {len(inserted)} inserted")
+            if failed:
+                logger.error(f"Error logging to Airtable: {len(failed)} records not inserted")
+            return not failed
             
         except Exception as e:
             logger.error(f"Error logging to Airtable: {str(e)}")
             return False
 
+    def sync_workers(self, workers: List[Worker]) -> Dict[str, bool]:
+        """Sync worker data to Google Sheets and Airtable in parallel"""
+        futures = {
+            'google_sheets': self._executor.submit(self.sync_workers_to_sheets, workers),
+            'airtable': self._executor.submit(self.sync_workers_to_airtable, workers)
+        }
+        return {name: future.result() for name, future in futures.items()}
+
     def sync_workers_to_sheets(self, workers: List[Worker]) -> bool:
         """Sync worker data to Google Sheets"""
         if not self.google_sheets_service:
@@ -173,36 +576,62 @@ class DataStorageService:
                     worker.phone or '',
                     worker.shift or '',
                     'Active' if worker.is_active else 'Inactive',
-                    worker.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    worker.updated_at.strftime('%Y-%m-%d %H:%M:%S')
+                    worker.created_at.isoformat(sep=' ', timespec='seconds'),
+                    worker.updated_at.isoformat(sep=' ', timespec='seconds')
                 ])
             
-            # Clear existing data and add new data
+            # Clear existing data and add new data in a single batchUpdate
+            sheet_id = self._get_workers_sheet_id()
             body = {
-                'values': worker_data
+                'requests': [
+                    {
+                        'updateCells': {
+                            'range': {'sheetId': sheet_id, 'startColumnIndex': 0, 'endColumnIndex': 10},
+                            'fields': 'userEnteredValue'
+                        }
+                    },
+                    {
+                        'updateCells': {
+                            'start': {'sheetId': sheet_id, 'rowIndex': 0, 'columnIndex': 0},
+                            'rows': [
+                                {'values': [{'userEnteredValue': {'stringValue': value or ''}} for value in row]}
+                                for row in worker_data
+                            ],
+                            'fields': 'userEnteredValue'
+                        }
+                    }
+                ]
             }
             
-            # Clear the sheet first
-            self.google_sheets_service.spreadsheets().values().clear(
-                spreadsheetId=settings.GOOGLE_SHEETS_SPREADSHEET_ID,
-                range='Workers!A:J'
-            ).execute()
-            
-            # Add new data
-            result = self.google_sheets_service.spreadsheets().values().update(
-                spreadsheetId=settings.GOOGLE_SHEETS_SPREADSHEET_ID,
-                range='Workers!A:J',
-                valueInputOption='RAW',
-                body=body
-            ).execute()
+            self._execute_sheets(
+                self.google_sheets_service.spreadsheets().batchUpdate(
+                    spreadsheetId=settings.GOOGLE_SHEETS_SPREADSHEET_ID,
+                    body=body
+                )
+            )
             
-            logger.info(f"Workers synced to Google Sheets: {result.get('updatedRows', 0)} rows updated")
+            logger.info(f"Workers synced to Google Sheets: {len(worker_data)} rows updated")
             return True
             
         except Exception as e:
             logger.error(f"Error syncing workers to Google Sheets: {str(e)}")
             return False
 
+    def _get_workers_sheet_id(self) -> int:
+        """Look up (once) the numeric sheet id of the Workers tab"""
+        if self._workers_sheet_id is None:
+            spreadsheet = self._execute_sheets(
+                self.google_sheets_service.spreadsheets().get(
+                    spreadsheetId=settings.GOOGLE_SHEETS_SPREADSHEET_ID,
+                    fields='sheets.properties(sheetId,title)'
+                )
+            )
+            self._workers_sheet_id = next(
+                sheet['properties']['sheetId'] for sheet in spreadsheet['sheets']
+                if sheet['properties']['title'] == 'Workers'
+            )
+        return self._workers_sheet_id
+
     def sync_workers_to_airtable(self, workers: List[Worker]) -> bool:
         """Sync worker data to Airtable"""
         if not self.airtable_service:
@@ -210,10 +639,11 @@ class DataStorageService:
         
         try:
             # Get existing records
-            existing_records = self.airtable_service.get_all()
-            existing_worker_ids = {record['fields'].get('Worker ID') for record in existing_records}
+            existing_ids = self._get_airtable_worker_ids([worker.worker_id for worker in workers])
             
-            # Prepare worker data
+            # Prepare worker data, split into updates and inserts
+            to_insert = []
+            to_update = []
             for worker in workers:
                 worker_data = {
                     'Worker ID': worker.worker_id,
@@ -228,65 +658,171 @@ class DataStorageService:
                     'Updated At': worker.updated_at.isoformat()
                 }
                 
-                if worker.worker_id in existing_worker_ids:
-                    # Update existing record
-                    record_id = next(
-                        record['id'] for record in existing_records 
-                        if record['fields'].get('Worker ID') == worker.worker_id
-                    )
-                    self.airtable_service.update(record_id, worker_data)
+                if worker.worker_id in existing_ids:
+                    to_update.append({'id': existing_ids[worker.worker_id], 'fields': worker_data})
                 else:
-                    # Create new record
-                    self.airtable_service.insert(worker_data)
+                    to_insert.append(worker_data)
+            
+            # Both send 10 records per request, several requests at a time
+            failed = []
+            if to_update:
+                _, failed_updates = self._airtable_batch('PATCH', to_update)
+                if failed_updates:
+                    # The cached ids may be stale (e.g. rows deleted in Airtable)
+                    self._airtable_id_cache = None
+                failed += failed_updates
+            if to_insert:
+                inserted, failed_inserts = self._airtable_batch('POST', [{'fields': fields} for fields in to_insert])
+                existing_ids.update(
+                    (record['fields'].get('Worker ID'), record['id']) for record in inserted
+                )
+                failed += failed_inserts
+            
+            if failed:
+                logger.error(f"Error syncing workers to Airtable: {len(failed)} of {len(workers)} records failed")
+                return False
             
             logger.info(f"Workers synced to Airtable: {len(workers)} records processed")
             return True
             
         except Exception as e:
+            # The cached ids may be stale (e.g. rows deleted in Airtable)
+            self._airtable_id_cache = None
             logger.error(f"Error syncing workers to Airtable: {str(e)}")
             return False
 
+    def _airtable_batch(self, method: str, records: List[Dict[str, Any]]) -> tuple:
+        """Create (POST) or update (PATCH) records in concurrent 10-record batches
+        
+        Returns (records returned by Airtable, input records of the batches that failed)
+        """
+        chunks = [
+            records[i:i + AIRTABLE_BATCH_SIZE]
+            for i in range(0, len(records), AIRTABLE_BATCH_SIZE)
+        ]
+        loop = self._get_airtable_loop()
+        return asyncio.run_coroutine_threadsafe(self._airtable_batch_async(method, chunks), loop).result()
+
+    def _get_airtable_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the Airtable event loop thread and HTTP session on first use"""
+        with self._airtable_loop_lock:
+            if self._airtable_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="airtable-io", daemon=True).start()
+                self._airtable_session = asyncio.run_coroutine_threadsafe(self._create_airtable_session(), loop).result()
+                self._airtable_loop = loop
+        
+        return self._airtable_loop
+
+    async def _create_airtable_session(self) -> aiohttp.ClientSession:
+        """Create the pooled HTTP session used for Airtable batch requests"""
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=AIRTABLE_CONCURRENCY),
+            headers={'Authorization': f"Bearer {settings.AIRTABLE_API_KEY}"},
+            timeout=aiohttp.ClientTimeout(total=AIRTABLE_TIMEOUT),
+            json_serialize=json_utils.dumps
+        )
+
+    async def _airtable_batch_async(self, method: str, chunks: List[List[Dict[str, Any]]]) -> tuple:
+        """Send every batch request concurrently; a failed batch does not fail the others"""
+        results = await asyncio.gather(
+            *(self._send_airtable_chunk(method, chunk) for chunk in chunks),
+            return_exceptions=True
+        )
+        
+        returned, failed = [], []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                logger.error(f"Airtable {method} of {len(chunk)} records failed: {str(result)}")
+                failed.extend(chunk)
+            else:
+                returned.extend(result)
+        return returned, failed
+
+    async def _send_airtable_chunk(self, method: str, chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Send one batch request, retrying rate-limited and server errors with backoff"""
+        for attempt in range(1, AIRTABLE_MAX_ATTEMPTS + 1):
+            await self._airtable_bucket.acquire_async()
+            try:
+                async with self._airtable_session.request(
+                    method, self.airtable_service.url_table, json={'records': chunk}
+                ) as response:
+                    if response.status == 429:
+                        delay = AIRTABLE_LOCKOUT
+                    elif response.status >= 500:
+                        delay = AIRTABLE_RETRY_BACKOFF * 2 ** (attempt - 1)
+                    else:
+                        response.raise_for_status()
+                        return (await response.json())['records']
+                    
+                    if attempt == AIRTABLE_MAX_ATTEMPTS:
+                        response.raise_for_status()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == AIRTABLE_MAX_ATTEMPTS:
+                    raise
+                delay = AIRTABLE_RETRY_BACKOFF * 2 ** (attempt - 1)
+            
+            logger.warning(f"Airtable {method} attempt {attempt} failed, retrying in {delay:g}s")
+            await asyncio.sleep(delay)
+
+    def _get_airtable_worker_ids(self, worker_ids: List[str]) -> Dict[str, str]:
+        """Map Worker ID to Airtable record id, cached for AIRTABLE_ID_CACHE_TTL"""
+        now = time.monotonic()
+        if self._airtable_id_cache is None or now - self._airtable_id_cache[0] >= AIRTABLE_ID_CACHE_TTL:
+            self._airtable_id_cache = (now, {})
+        id_map = self._airtable_id_cache[1]
+        
+        # Only look up the workers being synced that are not cached yet
+        missing = [worker_id for worker_id in dict.fromkeys(worker_ids) if worker_id not in id_map]
+        for i in range(0, len(missing), AIRTABLE_FORMULA_CHUNK):
+            chunk = missing[i:i + AIRTABLE_FORMULA_CHUNK]
+            formula = "OR(" + ",".join(
+                "{Worker ID}='" + worker_id.replace("'", "\\'") + "'" for worker_id in chunk
+            ) + ")"
+            # Stream pages into the map rather than collecting the full result first
+            for page in self.airtable_service.get_iter(
+                formula=formula,
+                fields=['Worker ID'],
+                page_size=AIRTABLE_FORMULA_CHUNK
+            ):
+                id_map.update((record['fields'].get('Worker ID'), record['id']) for record in page)
+        
+        return id_map
+
     def export_compliance_report(self, records: List[PPEComplianceRecord], 
                                format: str = 'csv') -> Optional[str]:
         """Export compliance records to file"""
         try:
-            # Convert records to DataFrame
-            data = []
-            for record in records:
-                data.append({
-                    'Timestamp': record.timestamp,
-                    'Worker ID': record.worker_id,
-                    'Worker Name': record.worker_name,
-                    'Department': record.department,
-                    'Location': record.location,
-                    'Shift': record.shift,
-                    'Helmet Detected': record.helmet_detected,
-                    'Helmet Confidence': record.helmet_confidence,
-                    'Mask Detected': record.mask_detected,
-                    'Mask Confidence': record.mask_confidence,
-                    'Gloves Detected': record.gloves_detected,
-                    'Gloves Confidence': record.gloves_confidence,
-                    'Jacket Detected': record.jacket_detected,
-                    'Jacket Confidence': record.jacket_confidence,
-                    'Is Compliant': record.is_compliant,
-                    'Compliance Score': record.compliance_score,
-                    'Alert Sent': record.alert_sent,
-                    'Alert Channels': record.alert_channels,
-                    'Notes': record.notes
-                })
-            
-            df = pd.DataFrame(data)
-            
             # Export based on format
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"compliance_report_{timestamp}.{format}"
             
             if format.lower() == 'csv':
-                df.to_csv(filename, index=False)
+                # Stream rows straight to the file
+                with open(filename, 'w', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(_EXPORT_HEADERS)
+                    writer.writerows(_export_row(record) for record in records)
             elif format.lower() == 'excel':
-                df.to_excel(filename, index=False)
+                if OPENPYXL_AVAILABLE:
+                    workbook = Workbook(write_only=True)
+                    sheet = workbook.create_sheet()
+                    sheet.append(_EXPORT_HEADERS)
+                    for record in records:
+                        sheet.append(_export_row(record))
+                    workbook.save(filename)
+                else:
+                    self._records_to_df(records).to_excel(filename, index=False)
             elif format.lower() == 'json':
-                df.to_json(filename, orient='records', date_format='iso')
+                with open(filename, 'wb') as f:
+                    f.write(json_utils.dumps_bytes([_json_export_row(record) for record in records]))
+            elif format.lower() == 'parquet':
+                if not PYARROW_AVAILABLE:
+                    logger.error("Parquet export requires pyarrow")
+                    return None
+                
+                df = self._records_to_df(records).astype(_PARQUET_DTYPES)
+                df.to_parquet(filename, engine='pyarrow', compression='zstd', use_dictionary=True, index=False)
             else:
                 logger.error(f"Unsupported export format: {format}")
                 return None
@@ -298,87 +834,141 @@ class DataStorageService:
             logger.error(f"Error exporting compliance report: {str(e)}")
             return None
 
-    def get_compliance_analytics(self, records: List[PPEComplianceRecord]) -> Dict[str, Any]:
-        """Generate analytics from compliance records"""
+    def stream_compliance_csv(self, start_date: datetime,
+                              department: Optional[str] = None) -> Iterator[str]:
+        """Yield a CSV compliance report in chunks while rows are read from the database
+        
+        Uses its own session so the response can outlive the request's session.
+        """
+        stmt = _EXPORT_SELECT.where(PPEComplianceRecord.timestamp >= start_date)
+        if department:
+            stmt = stmt.where(PPEComplianceRecord.department == department)
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(_EXPORT_HEADERS)
+        
+        with SessionLocal() as db:
+            result = db.execute(stmt.execution_options(yield_per=EXPORT_STREAM_BATCH))
+            for rows in result.partitions():
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def _records_to_df(self, records: List[PPEComplianceRecord]) -> pd.DataFrame:
+        """Convert compliance records to a DataFrame"""
+        data = []
+        for record in records:
+            data.append({
+                'Timestamp': record.timestamp,
+                'Worker ID': record.worker_id,
+                'Worker Name': record.worker_name,
+                'Department': record.department,
+                'Location': record.location,
+                'Shift': record.shift,
+                'Helmet Detected': record.helmet_detected,
+                'Helmet Confidence': record.helmet_confidence,
+                'Mask Detected': record.mask_detected,
+                'Mask Confidence': record.mask_confidence,
+                'Gloves Detected': record.gloves_detected,
+                'Gloves Confidence': record.gloves_confidence,
+                'Jacket Detected': record.jacket_detected,
+                'Jacket Confidence': record.jacket_confidence,
+                'Is Compliant': record.is_compliant,
+                'Compliance Score': record.compliance_score,
+                'Alert Sent': record.alert_sent,
+                'Alert Channels': record.alert_channels,
+                'Notes': record.notes
+            })
+        
+        # Explicit columns keep the headers (and Parquet dtypes) for an empty export
+        return pd.DataFrame(data, columns=_EXPORT_HEADERS)
+
+    def get_compliance_analytics_from_rollups(self, rollups: List[Any]) -> Dict[str, Any]:
+        """Generate analytics from SQL rollup rows grouped by department and hour
+        
+        Each row is (department, hour, total, compliant, helmet, mask, gloves, jacket).
+        """
+        if not rollups:
+            return {}
+        
         try:
-            if not records:
-                return {}
-            
-            # Basic statistics
-            total_records = len(records)
-            compliant_records = len([r for r in records if r.is_compliant])
-            non_compliant_records = total_records - compliant_records
-            compliance_rate = (compliant_records / total_records * 100) if total_records > 0 else 0
-            
-            # PPE item statistics
-            ppe_stats = {
-                'helmet': {
-                    'detected': len([r for r in records if r.helmet_detected]),
-                    'rate': len([r for r in records if r.helmet_detected]) / total_records * 100
-                },
-                'mask': {
-                    'detected': len([r for r in records if r.mask_detected]),
-                    'rate': len([r for r in records if r.mask_detected]) / total_records * 100
-                },
-                'gloves': {
-                    'detected': len([r for r in records if r.gloves_detected]),
-                    'rate': len([r for r in records if r.gloves_detected]) / total_records * 100
-                },
-                'jacket': {
-                    'detected': len([r for r in records if r.jacket_detected]),
-                    'rate': len([r for r in records if r.jacket_detected]) / total_records * 100
-                }
-            }
-            
-            # Department statistics
-            departments = {}
-            for record in records:
-                dept = record.department or 'Unknown'
-                if dept not in departments:
-                    departments[dept] = {'total': 0, 'compliant': 0}
-                departments[dept]['total'] += 1
-                if record.is_compliant:
-                    departments[dept]['compliant'] += 1
-            
-            # Calculate department compliance rates
-            for dept in departments:
-                total = departments[dept]['total']
-                compliant = departments[dept]['compliant']
-                departments[dept]['rate'] = (compliant / total * 100) if total > 0 else 0
-            
-            # Time-based analysis
-            records_by_hour = {}
-            for record in records:
-                hour = record.timestamp.hour
-                if hour not in records_by_hour:
-                    records_by_hour[hour] = {'total': 0, 'compliant': 0}
-                records_by_hour[hour]['total'] += 1
-                if record.is_compliant:
-                    records_by_hour[hour]['compliant'] += 1
+            counts = np.array([tuple(row[2:]) for row in rollups], dtype=np.int64)
+            dept_names, dept_idx = np.unique(
+                np.array([row[0] or 'Unknown' for row in rollups], dtype=object),
+                return_inverse=True
+            )
+            hour_idx = np.array([row[1] for row in rollups], dtype=np.intp)
             
-            # Calculate hourly compliance rates
-            for hour in records_by_hour:
-                total = records_by_hour[hour]['total']
-                compliant = records_by_hour[hour]['compliant']
-                records_by_hour[hour]['rate'] = (compliant / total * 100) if total > 0 else 0
+            # Re-group the (department, hour) cells along each axis
+            departments = self._compliance_rates(
+                dept_names.tolist(),
+                np.bincount(dept_idx, weights=counts[:, 0], minlength=len(dept_names)).astype(np.int64),
+                np.bincount(dept_idx, weights=counts[:, 1], minlength=len(dept_names)).astype(np.int64)
+            )
+            hour_totals = np.bincount(hour_idx, weights=counts[:, 0], minlength=24).astype(np.int64)
+            hour_compliant = np.bincount(hour_idx, weights=counts[:, 1], minlength=24).astype(np.int64)
             
-            return {
-                'summary': {
-                    'total_records': total_records,
-                    'compliant_records': compliant_records,
-                    'non_compliant_records': non_compliant_records,
-                    'compliance_rate': compliance_rate
-                },
-                'ppe_statistics': ppe_stats,
-                'department_statistics': departments,
-                'hourly_statistics': records_by_hour,
-                'generated_at': datetime.utcnow().isoformat()
-            }
+            column_totals = counts.sum(axis=0).tolist()
+            return self._analytics_result(
+                column_totals[0], column_totals[1:], departments, hour_totals, hour_compliant
+            )
             
         except Exception as e:
-            logger.error(f"Error generating compliance analytics: {str(e)}")
+            logger.error(f"Error generating compliance analytics from rollups: {str(e)}")
             return {}
 
+    def _analytics_result(self, total_records: int, detected_counts: List[int],
+                          departments: Dict[Any, Dict[str, Any]],
+                          hour_totals: np.ndarray, hour_compliant: np.ndarray) -> Dict[str, Any]:
+        """Assemble the analytics payload from aggregated counts
+        
+        detected_counts holds the compliant count followed by helmet, mask,
+        gloves and jacket detections.
+        """
+        compliant_records = detected_counts[0]
+        non_compliant_records = total_records - compliant_records
+        compliance_rate = (compliant_records / total_records * 100) if total_records > 0 else 0
+        
+        # PPE item statistics
+        ppe_stats = {
+            item: {'detected': detected, 'rate': detected / total_records * 100}
+            for item, detected in zip(('helmet', 'mask', 'gloves', 'jacket'), detected_counts[1:])
+        }
+        
+        hours = np.flatnonzero(hour_totals)
+        records_by_hour = self._compliance_rates(
+            hours.tolist(), hour_totals[hours], hour_compliant[hours]
+        )
+        
+        return {
+            'summary': {
+                'total_records': total_records,
+                'compliant_records': compliant_records,
+                'non_compliant_records': non_compliant_records,
+                'compliance_rate': compliance_rate
+            },
+            'ppe_statistics': ppe_stats,
+            'department_statistics': departments,
+            'hourly_statistics': records_by_hour,
+            'generated_at': datetime.utcnow().isoformat()
+        }
+
+    def _compliance_rates(self, keys: List[Any], totals: np.ndarray, compliant: np.ndarray) -> Dict[Any, Dict[str, Any]]:
+        """Total, compliant count and compliance rate per group"""
+        return {
+            key: {
+                'total': total,
+                'compliant': count,
+                'rate': (count / total * 100) if total > 0 else 0
+            }
+            for key, total, count in zip(keys, totals.tolist(), compliant.tolist())
+        }
+
 # Global data storage service instance
 data_storage = DataStorageService()
 
@@ -0,0 +1,23 @@
+import multiprocessing
+import os
+from config import settings
+
+# Production server settings: gunicorn -c gunicorn_conf.py main:app
+# Uvicorn workers pick up uvloop and httptools automatically when
+# uvicorn[standard] is installed
+
+bind = f"{settings.HOST}:{settings.PORT}"
+
+# One event loop per process so every CPU core serves requests
+workers = int(os.getenv("WEB_CONCURRENCY", str(2 * multiprocessing.cpu_count() + 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+worker_connections = 1000
+
+# Keep-alive for clients and proxies (e.g. nginx) reusing connections
+keepalive = 5
+timeout = 60
+graceful_timeout = 30
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
@@ -0,0 +1,27 @@
+import json
+from datetime import date, datetime
+
+# orjson is optional; fall back to the standard library when it is missing
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _default(obj):
+    """Encode datetimes the way orjson does for the standard library fallback"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj) -> str:
+    """Serialize an object to a JSON string"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, default=_default)
+
+def dumps_bytes(obj) -> bytes:
+    """Serialize an object to UTF-8 encoded JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default).encode()
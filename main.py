@@ -1,29 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+from sqlalchemy import case, extract, func, select
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 import logging
 import os
-import base64
 from datetime import datetime, timedelta
 import json
 
 # Import our modules
-from models import get_db, create_tables, PPEComplianceRecord, Worker, ComplianceAlert
+from models import get_db, create_tables, PPEComplianceRecord, Worker, ComplianceAlert, get_worker_by_worker_id
 from schemas import (
     ComplianceCheckRequest, ComplianceCheckResponse, WorkerCreate, WorkerResponse,
     ComplianceRecordResponse, DashboardStats, WebhookPayload, AlertRequest
 )
-from compliance_service import ComplianceService
-from alert_service import AlertService
-from data_storage import data_storage
+from compliance_service import ComplianceService, compliance_service, get_compliance_service
+from ppe_detector import ppe_detector
+from alert_service import alert_service
+from data_storage import data_storage, EXTERNAL_RECORD_OPTIONS
 from config import settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# List endpoints select exactly the response-model columns as plain rows,
+# skipping ORM instance hydration and the identity map
+_WORKER_COLUMNS = tuple(getattr(Worker, name) for name in WorkerResponse.model_fields)
+_RECORD_COLUMNS = tuple(getattr(PPEComplianceRecord, name) for name in ComplianceRecordResponse.model_fields)
+
+# Latest violations for the dashboard; the statement is fixed, so build it once
+_RECENT_VIOLATIONS = select(*_RECORD_COLUMNS)\
+    .where(PPEComplianceRecord.is_compliant == False)\
+    .order_by(PPEComplianceRecord.timestamp.desc())\
+    .limit(10)
+
 # Create FastAPI app
 app = FastAPI(
     title="Smart PPE Compliance Checker",
@@ -40,14 +53,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-alert_service = AlertService()
-
-# Create database tables on startup
+# Create database tables on startup (unless the schema is managed at deploy time)
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
-    logger.info("Database tables created successfully")
+    if settings.AUTO_CREATE_TABLES:
+        create_tables()
+        logger.info("Database tables created successfully")
+    
+    if settings.WARM_CONNECTIONS:
+        alert_service.warm_connections()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await compliance_service.aclose()
+    await ppe_detector.aclose()
+
+def _get_record(db: Session, record_id: int) -> Optional[PPEComplianceRecord]:
+    """Load a compliance record by id (blocking; async handlers run it in the threadpool)"""
+    return db.query(PPEComplianceRecord).filter(PPEComplianceRecord.id == record_id).first()
+
+# Uploads are read in chunks so oversized files are rejected without
+# buffering them whole
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """Read an uploaded file, raising 413 once it exceeds MAX_UPLOAD_BYTES"""
+    buffer = bytearray()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        buffer += chunk
+        if len(buffer) > settings.MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Uploaded image is too large")
+    return bytes(buffer)
+
+async def _read_body(http_request: Request) -> bytes:
+    """Read a raw request body, raising 413 once it exceeds MAX_UPLOAD_BYTES"""
+    buffer = bytearray()
+    async for chunk in http_request.stream():
+        buffer += chunk
+        if len(buffer) > settings.MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Uploaded image is too large")
+    return bytes(buffer)
+
+# Handlers that only touch the database are plain `def` so Starlette runs them
+# in its threadpool instead of blocking the event loop on SQL round trips
 
 # Health check endpoint
 @app.get("/health")
@@ -59,20 +107,15 @@ async def health_check():
 async def check_compliance(
     request: ComplianceCheckRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    service: ComplianceService = Depends(get_compliance_service)
 ):
     """Main endpoint for PPE compliance checking"""
     try:
-        compliance_service = ComplianceService(db)
-        result = compliance_service.check_compliance(request)
+        result = await service.check_compliance(request)
         
-        # Log to external storage in background
+        # Log to external storage in background (the task loads the record)
         if result.success and result.record_id:
-            record = db.query(PPEComplianceRecord).filter(
-                PPEComplianceRecord.id == result.record_id
-            ).first()
-            if record:
-                background_tasks.add_task(data_storage.log_compliance_record, record)
+            background_tasks.add_task(data_storage.log_compliance_record_by_id, result.record_id)
         
         return result
         
@@ -80,7 +123,7 @@ async def check_compliance(
         logger.error(f"Error in compliance check: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/compliance/check-upload")
+@app.post("/api/compliance/check-upload", response_model=ComplianceCheckResponse)
 async def check_compliance_upload(
     background_tasks: BackgroundTasks,
     worker_id: str = Form(...),
@@ -89,35 +132,28 @@ async def check_compliance_upload(
     department: Optional[str] = Form(None),
     shift: Optional[str] = Form(None),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    service: ComplianceService = Depends(get_compliance_service)
 ):
     """Check compliance from uploaded image file"""
+    # Read image; the raw bytes are forwarded to Roboflow without base64
+    image_data = await _read_upload(file)
+    
     try:
-        # Read and encode image
-        image_data = await file.read()
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-        
         # Create request
         request = ComplianceCheckRequest(
             worker_id=worker_id,
             worker_name=worker_name,
             location=location,
             department=department,
-            shift=shift,
-            image_base64=image_base64
+            shift=shift
         )
         
         # Check compliance
-        compliance_service = ComplianceService(db)
-        result = compliance_service.check_compliance(request)
+        result = await service.check_compliance(request, image_bytes=image_data)
         
-        # Log to external storage in background
+        # Log to external storage in background (the task loads the record)
         if result.success and result.record_id:
-            record = db.query(PPEComplianceRecord).filter(
-                PPEComplianceRecord.id == result.record_id
-            ).first()
-            if record:
-                background_tasks.add_task(data_storage.log_compliance_record, record)
+            background_tasks.add_task(data_storage.log_compliance_record_by_id, result.record_id)
         
         return result
         
@@ -125,12 +161,52 @@ async def check_compliance_upload(
         logger.error(f"Error in compliance check upload: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/compliance/check-binary", response_model=ComplianceCheckResponse)
+async def check_compliance_binary(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    worker_id: str,
+    worker_name: Optional[str] = None,
+    location: Optional[str] = None,
+    department: Optional[str] = None,
+    shift: Optional[str] = None,
+    service: ComplianceService = Depends(get_compliance_service)
+):
+    """Check compliance from a raw image request body"""
+    # The body is the image itself, so there is no multipart or base64 decoding
+    image_data = await _read_body(http_request)
+    if not image_data:
+        raise HTTPException(status_code=400, detail="Request body must contain an image")
+    
+    try:
+        request = ComplianceCheckRequest(
+            worker_id=worker_id,
+            worker_name=worker_name,
+            location=location,
+            department=department,
+            shift=shift
+        )
+        
+        # Check compliance
+        result = await service.check_compliance(request, image_bytes=image_data)
+        
+        # Log to external storage in background (the task loads the record)
+        if result.success and result.record_id:
+            background_tasks.add_task(data_storage.log_compliance_record_by_id, result.record_id)
+        
+        return result
+        
+    except Exception as e:
+        logger.error(f"Error in binary compliance check: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Webhook endpoints for n8n integration
 @app.post("/api/webhooks/compliance")
 async def compliance_webhook(
     payload: WebhookPayload,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    service: ComplianceService = Depends(get_compliance_service)
 ):
     """Webhook endpoint for n8n compliance workflow"""
     try:
@@ -152,24 +228,14 @@ async def compliance_webhook(
             )
             
             # Process compliance check
-            compliance_service = ComplianceService(db)
-            result = compliance_service.check_compliance(request)
+            result = await service.check_compliance(request)
             
-            # Log to external storage in background
+            # Log to external storage in background (the task loads the record)
             if result.success and result.record_id:
-                record = db.query(PPEComplianceRecord).filter(
-                    PPEComplianceRecord.id == result.record_id
-                ).first()
-                if record:
-                    background_tasks.add_task(data_storage.log_compliance_record, record)
+                background_tasks.add_task(data_storage.log_compliance_record_by_id, result.record_id)
             
-            return {
-                "success": result.success,
-                "message": result.message,
-                "data": result.data.dict() if result.data else None,
-                "record_id": result.record_id,
-                "alert_sent": result.alert_sent
-            }
+            # Serialize the check result in one pass with pydantic-core
+            return Response(content=result.model_dump_json(), media_type="application/json")
         
         elif payload.event_type == "manual_alert":
             # Send manual alert
@@ -177,15 +243,13 @@ async def compliance_webhook(
             record_id = alert_data.get("record_id")
             
             if record_id:
-                record = db.query(PPEComplianceRecord).filter(
-                    PPEComplianceRecord.id == record_id
-                ).first()
+                record = await run_in_threadpool(_get_record, db, record_id)
                 
                 if record:
                     message = alert_data.get("message", "Manual alert triggered")
                     channels = alert_data.get("channels", ["slack", "email"])
                     
-                    results = alert_service.send_custom_alert(message, channels, record)
+                    results = await alert_service.send_custom_alert(message, channels, record)
                     return {"success": True, "alert_results": results}
             
             return {"success": False, "message": "Record not found"}
@@ -199,11 +263,11 @@ async def compliance_webhook(
 
 # Worker Management Endpoints
 @app.post("/api/workers", response_model=WorkerResponse)
-async def create_worker(worker: WorkerCreate, db: Session = Depends(get_db)):
+def create_worker(worker: WorkerCreate, db: Session = Depends(get_db)):
     """Create a new worker"""
     try:
         # Check if worker already exists
-        existing_worker = db.query(Worker).filter(Worker.worker_id == worker.worker_id).first()
+        existing_worker = get_worker_by_worker_id(db, worker.worker_id)
         if existing_worker:
             raise HTTPException(status_code=400, detail="Worker ID already exists")
         
@@ -220,21 +284,20 @@ async def create_worker(worker: WorkerCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/workers", response_model=List[WorkerResponse])
-async def get_workers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_workers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Get list of workers"""
     try:
-        workers = db.query(Worker).offset(skip).limit(limit).all()
-        return workers
+        return db.execute(select(*_WORKER_COLUMNS).offset(skip).limit(limit)).all()
         
     except Exception as e:
         logger.error(f"Error getting workers: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/workers/{worker_id}", response_model=WorkerResponse)
-async def get_worker(worker_id: str, db: Session = Depends(get_db)):
+def get_worker(worker_id: str, db: Session = Depends(get_db)):
     """Get specific worker by ID"""
     try:
-        worker = db.query(Worker).filter(Worker.worker_id == worker_id).first()
+        worker = get_worker_by_worker_id(db, worker_id)
         if not worker:
             raise HTTPException(status_code=404, detail="Worker not found")
         
@@ -246,7 +309,7 @@ async def get_worker(worker_id: str, db: Session = Depends(get_db)):
 
 # Compliance Records Endpoints
 @app.get("/api/compliance/records", response_model=List[ComplianceRecordResponse])
-async def get_compliance_records(
+def get_compliance_records(
     skip: int = 0,
     limit: int = 100,
     worker_id: Optional[str] = None,
@@ -256,24 +319,24 @@ async def get_compliance_records(
 ):
     """Get compliance records with optional filters"""
     try:
-        query = db.query(PPEComplianceRecord)
+        query = select(*_RECORD_COLUMNS)
         
         if worker_id:
-            query = query.filter(PPEComplianceRecord.worker_id == worker_id)
+            query = query.where(PPEComplianceRecord.worker_id == worker_id)
         if department:
-            query = query.filter(PPEComplianceRecord.department == department)
+            query = query.where(PPEComplianceRecord.department == department)
         if is_compliant is not None:
-            query = query.filter(PPEComplianceRecord.is_compliant == is_compliant)
+            query = query.where(PPEComplianceRecord.is_compliant == is_compliant)
         
-        records = query.order_by(PPEComplianceRecord.timestamp.desc()).offset(skip).limit(limit).all()
-        return records
+        query = query.order_by(PPEComplianceRecord.timestamp.desc()).offset(skip).limit(limit)
+        return db.execute(query).all()
         
     except Exception as e:
         logger.error(f"Error getting compliance records: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/compliance/records/{record_id}", response_model=ComplianceRecordResponse)
-async def get_compliance_record(record_id: int, db: Session = Depends(get_db)):
+def get_compliance_record(record_id: int, db: Session = Depends(get_db)):
     """Get specific compliance record by ID"""
     try:
         record = db.query(PPEComplianceRecord).filter(PPEComplianceRecord.id == record_id).first()
@@ -288,35 +351,35 @@ async def get_compliance_record(record_id: int, db: Session = Depends(get_db)):
 
 # Dashboard and Analytics Endpoints
 @app.get("/api/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats(
+def get_dashboard_stats(
     days: int = 7,
     department: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    service: ComplianceService = Depends(get_compliance_service)
 ):
     """Get dashboard statistics"""
     try:
-        compliance_service = ComplianceService(db)
-        
         if department:
-            stats = compliance_service.get_department_compliance_stats(department, days)
+            stats = service.get_department_compliance_stats(db, department, days)
         else:
-            stats = compliance_service.get_overall_compliance_stats(days)
+            stats = service.get_overall_compliance_stats(db, days)
         
         # Get today's stats
         today = datetime.utcnow().date()
-        today_records = db.query(PPEComplianceRecord).filter(
-            PPEComplianceRecord.timestamp >= today
-        ).all()
-        
-        today_total = len(today_records)
-        today_compliant = len([r for r in today_records if r.is_compliant])
+        today_row = db.execute(
+            select(
+                func.count().label('total'),
+                func.sum(case((PPEComplianceRecord.is_compliant, 1), else_=0)).label('compliant')
+            ).where(PPEComplianceRecord.timestamp >= today)
+        ).one()
+        
+        today_total = today_row.total
+        today_compliant = today_row.compliant or 0
         today_non_compliant = today_total - today_compliant
         today_rate = (today_compliant / today_total * 100) if today_total > 0 else 0
         
         # Get recent violations
-        recent_violations = db.query(PPEComplianceRecord).filter(
-            PPEComplianceRecord.is_compliant == False
-        ).order_by(PPEComplianceRecord.timestamp.desc()).limit(10).all()
+        recent_violations = db.execute(_RECENT_VIOLATIONS).all()
         
         return DashboardStats(
             total_checks=stats['total_checks'],
@@ -336,7 +399,7 @@ async def get_dashboard_stats(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/analytics/compliance")
-async def get_compliance_analytics(
+def get_compliance_analytics(
     days: int = 30,
     department: Optional[str] = None,
     db: Session = Depends(get_db)
@@ -346,17 +409,30 @@ async def get_compliance_analytics(
         from datetime import timedelta
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        query = db.query(PPEComplianceRecord).filter(
-            PPEComplianceRecord.timestamp >= start_date
-        )
+        # Roll records up per (department, hour) in the database so only a
+        # few hundred rows at most reach Python
+        department_col = func.coalesce(func.nullif(PPEComplianceRecord.department, ''), 'Unknown')
+        hour_col = extract('hour', PPEComplianceRecord.timestamp)
+        query = select(
+            department_col,
+            hour_col,
+            func.count(),
+            *(func.sum(case((flag, 1), else_=0)) for flag in (
+                PPEComplianceRecord.is_compliant,
+                PPEComplianceRecord.helmet_detected,
+                PPEComplianceRecord.mask_detected,
+                PPEComplianceRecord.gloves_detected,
+                PPEComplianceRecord.jacket_detected
+            ))
+        ).where(PPEComplianceRecord.timestamp >= start_date)
         
         if department:
-            query = query.filter(PPEComplianceRecord.department == department)
+            query = query.where(PPEComplianceRecord.department == department)
         
-        records = query.all()
+        rollups = db.execute(query.group_by(department_col, hour_col)).all()
         
         # Generate analytics
-        analytics = data_storage.get_compliance_analytics(records)
+        analytics = data_storage.get_compliance_analytics_from_rollups(rollups)
         
         return analytics
         
@@ -369,14 +445,12 @@ async def get_compliance_analytics(
 async def send_alert(alert_request: AlertRequest, db: Session = Depends(get_db)):
     """Send manual alert"""
     try:
-        record = db.query(PPEComplianceRecord).filter(
-            PPEComplianceRecord.id == alert_request.record_id
-        ).first()
+        record = await run_in_threadpool(_get_record, db, alert_request.record_id)
         
         if not record:
             raise HTTPException(status_code=404, detail="Record not found")
         
-        results = alert_service.send_custom_alert(
+        results = await alert_service.send_custom_alert(
             alert_request.message,
             alert_request.channels,
             record
@@ -390,7 +464,7 @@ async def send_alert(alert_request: AlertRequest, db: Session = Depends(get_db))
 
 # Data Export Endpoints
 @app.get("/api/export/compliance")
-async def export_compliance_data(
+def export_compliance_data(
     format: str = "csv",
     days: int = 30,
     department: Optional[str] = None,
@@ -401,7 +475,16 @@ async def export_compliance_data(
         from datetime import timedelta
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        query = db.query(PPEComplianceRecord).filter(
+        # CSV is streamed to the client while the database cursor is read
+        if format.lower() == 'csv':
+            filename = f"compliance_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            return StreamingResponse(
+                data_storage.stream_compliance_csv(start_date, department),
+                media_type='text/csv',
+                headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+            )
+        
+        query = db.query(PPEComplianceRecord).options(*EXTERNAL_RECORD_OPTIONS).filter(
             PPEComplianceRecord.timestamp >= start_date
         )
         
@@ -428,14 +511,12 @@ async def export_compliance_data(
 
 # Data Sync Endpoints
 @app.post("/api/sync/workers")
-async def sync_workers_to_external(db: Session = Depends(get_db)):
+def sync_workers_to_external(db: Session = Depends(get_db)):
     """Sync workers to external storage systems"""
     try:
         workers = db.query(Worker).all()
         
-        results = {}
-        results['google_sheets'] = data_storage.sync_workers_to_sheets(workers)
-        results['airtable'] = data_storage.sync_workers_to_airtable(workers)
+        results = data_storage.sync_workers(workers)
         
         return {"success": True, "results": results}
         
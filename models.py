@@ -1,9 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, Text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import deferred, sessionmaker
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
 from datetime import datetime
 from config import settings
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -11,7 +17,7 @@ class PPEComplianceRecord(Base):
     __tablename__ = "ppe_compliance_records"
     
     id = Column(Integer, primary_key=True, index=True)
-    worker_id = Column(String, index=True)
+    worker_id = Column(String)
     worker_name = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
     image_path = Column(String)
@@ -39,11 +45,27 @@ class PPEComplianceRecord(Base):
     
     # Alert Status
     alert_sent = Column(Boolean, default=False)
-    alert_channels = Column(Text)  # JSON string of channels used
+    # Text columns are deferred: listings and stats never read them, so they
+    # are only loaded on access or when a query undefers them
+    alert_channels = deferred(Column(Text))  # JSON string of channels used
     
     # Additional Data
-    raw_detection_data = Column(Text)  # JSON string of full detection results
-    notes = Column(Text)
+    raw_detection_data = deferred(Column(Text))  # JSON string of full detection results
+    notes = deferred(Column(Text))
+    
+    __table_args__ = (
+        # Time-windowed stats grouped or filtered by department; including
+        # is_compliant lets the compliance counts be read from the index alone
+        Index('ix_ppe_records_timestamp_department_compliant', 'timestamp', 'department', 'is_compliant'),
+        # Per-worker history, newest first (scanned backwards); also serves
+        # plain worker_id lookups, so the column needs no index of its own
+        Index('ix_ppe_records_worker_timestamp', 'worker_id', 'timestamp'),
+        # Record listings and stats filtered by department, newest first
+        # (is_compliant included so department stats are covered too)
+        Index('ix_ppe_records_department_timestamp_compliant', 'department', 'timestamp', 'is_compliant'),
+        # Latest violations for the dashboard, newest first
+        Index('ix_ppe_records_compliant_timestamp', 'is_compliant', 'timestamp'),
+    )
 
 class Worker(Base):
     __tablename__ = "workers"
@@ -75,11 +97,53 @@ class ComplianceAlert(Base):
     acknowledged_at = Column(DateTime)
 
 # Database setup
-engine = create_engine(settings.DATABASE_URL)
+# Sessions are used from threadpool threads, so SQLite must not pin
+# connections to the thread that created them
+database_url = make_url(settings.DATABASE_URL)
+is_sqlite = database_url.get_backend_name() == "sqlite"
+connect_args = {"check_same_thread": False} if is_sqlite else {}
+# Size the pool for concurrent requests. An in-memory SQLite database only
+# exists on the connection that created it, so every thread shares one
+# (meant for tests and local runs, not concurrent load)
+is_memory_db = is_sqlite and database_url.database in (None, "", ":memory:")
+pool_args = {"poolclass": StaticPool} if is_memory_db else {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+engine = create_engine(settings.DATABASE_URL, connect_args=connect_args, **pool_args)
+
+@event.listens_for(engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+    if elapsed_ms > settings.SLOW_QUERY_MS:
+        logger.warning(f"Slow query ({elapsed_ms:.1f} ms): {statement}")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# run.py initializes the database before starting the app in-process, so the
+# startup event's call is skipped once tables exist
+_tables_created = False
+
 def create_tables():
+    global _tables_created
+    if _tables_created:
+        return
+    
     Base.metadata.create_all(bind=engine)
+    
+    # create_all only builds indexes along with new tables, so add any
+    # indexes that are missing from tables created by an older version
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    _tables_created = True
 
 def get_db():
     db = SessionLocal()
@@ -88,4 +152,14 @@ def get_db():
     finally:
         db.close()
 
-
+def get_worker_by_worker_id(db, worker_id: str):
+    """Look up a worker by its external ID, memoized for the life of the session"""
+    # worker_id is not the primary key, so Session.get() and the identity
+    # map cannot serve repeat lookups; keep them in the session's info dict
+    workers = db.info.setdefault("workers_by_worker_id", {})
+    worker = workers.get(worker_id)
+    if worker is None:
+        worker = db.execute(select(Worker).where(Worker.worker_id == worker_id)).scalar_one_or_none()
+        if worker is not None:
+            workers[worker_id] = worker
+    return worker
@@ -1,13 +1,43 @@
-import requests
+import asyncio
+import httpx
 import base64
+import binascii
+import hashlib
 import json
+import re
+import threading
+from cachetools import TTLCache
+from operator import attrgetter
 from typing import Dict, List, Optional, Tuple
 from config import settings
 from schemas import PPEDetectionResult, RoboflowResponse, RoboflowDetection
 import logging
 
+# HTTP/2 support for httpx is optional (installed with httpx[http2])
+try:
+    import h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Detection results cached by SHA-256 of the image bytes, so retried or
+# replayed images skip the Roboflow round trip
+DETECTION_CACHE_SIZE = 4096
+DETECTION_CACHE_TTL = 600
+
+# PPE items checked on every worker, in reporting order; the result model has
+# a <type>_detected and <type>_confidence field for each
+_PPE_TYPES = ('helmet', 'mask', 'gloves', 'jacket')
+_PPE_FIELDS = {ppe_type: (f'{ppe_type}_detected', f'{ppe_type}_confidence') for ppe_type in _PPE_TYPES}
+_detected_flags = attrgetter(*(detected for detected, _ in _PPE_FIELDS.values()))
+
+def _read_file_bytes(path: str) -> bytes:
+    """Read a whole file unbuffered (a single read into one bytes object)"""
+    with open(path, 'rb', buffering=0) as f:
+        return f.read()
+
 class PPEDetector:
     def __init__(self):
         self.api_key = settings.ROBOFLOW_API_KEY
@@ -15,6 +45,9 @@ class PPEDetector:
         self.model_version = settings.ROBOFLOW_MODEL_VERSION
         self.base_url = f"https://detect.roboflow.com/{self.project_id}/{self.model_version}"
         
+        # One pooled client so inference calls reuse keep-alive connections
+        self._client = self._new_client()
+        
         # PPE class mappings (adjust based on your Roboflow model)
         self.ppe_classes = {
             'helmet': ['helmet', 'hard_hat', 'safety_helmet'],
@@ -30,8 +63,22 @@ class PPEDetector:
             'gloves': 0.5,
             'jacket': 0.5
         }
+        
+        # One alternation pattern per PPE type, so matching a label is a single
+        # scan per type instead of a substring search per variant
+        self._ppe_patterns = {
+            ppe_type: re.compile('|'.join(map(re.escape, class_variants)))
+            for ppe_type, class_variants in self.ppe_classes.items()
+        }
+        
+        # Roboflow class label -> PPE types it matches, filled on first sight
+        # (models emit a small fixed label set, so this stays tiny)
+        self._class_ppe_types: Dict[str, Tuple[str, ...]] = {}
+        
+        self._result_cache = TTLCache(maxsize=DETECTION_CACHE_SIZE, ttl=DETECTION_CACHE_TTL)
+        self._result_cache_lock = threading.Lock()
 
-    def detect_ppe_from_url(self, image_url: str) -> PPEDetectionResult:
+    async def detect_ppe_from_url(self, image_url: str) -> PPEDetectionResult:
         """Detect PPE from image URL using Roboflow API"""
         try:
             params = {
@@ -39,7 +86,7 @@ class PPEDetector:
                 'image': image_url
             }
             
-            response = requests.get(self.base_url, params=params)
+            response = await self._client.get(self.base_url, params=params)
             response.raise_for_status()
             
             roboflow_data = response.json()
@@ -49,43 +96,121 @@ class PPEDetector:
             logger.error(f"Error detecting PPE from URL: {str(e)}")
             return PPEDetectionResult()
 
-    def detect_ppe_from_base64(self, image_base64: str) -> PPEDetectionResult:
+    async def detect_ppe_from_base64(self, image_base64: str) -> PPEDetectionResult:
         """Detect PPE from base64 encoded image using Roboflow API"""
         try:
             # Remove data URL prefix if present
             if ',' in image_base64:
                 image_base64 = image_base64.split(',')[1]
             
+            # Key on the decoded bytes so uploads and base64 posts share entries
+            try:
+                cache_key = hashlib.sha256(base64.b64decode(image_base64)).digest()
+            except (binascii.Error, ValueError):
+                cache_key = None
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                return cached
+            
             params = {
                 'api_key': self.api_key
             }
             
-            data = {
-                'image': image_base64
+            # Roboflow accepts the base64 string as the raw request body
+            response = await self._client.post(
+                self.base_url,
+                params=params,
+                content=image_base64,
+                headers={'Content-Type': 'application/x-www-form-urlencoded'}
+            )
+            response.raise_for_status()
+            
+            roboflow_data = response.json()
+            result = self._process_roboflow_response(roboflow_data)
+            self._cache_result(cache_key, result)
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error detecting PPE from base64: {str(e)}")
+            return PPEDetectionResult()
+
+    async def detect_ppe_from_bytes(self, image_data: bytes) -> PPEDetectionResult:
+        """Detect PPE from raw image bytes using Roboflow API (multipart upload)"""
+        try:
+            cache_key = hashlib.sha256(image_data).digest()
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                return cached
+            
+            params = {
+                'api_key': self.api_key
             }
             
-            response = requests.post(self.base_url, params=params, data=data)
+            # Upload the bytes as-is, skipping the base64 encode/decode round trip
+            response = await self._client.post(
+                self.base_url,
+                params=params,
+                files={'file': image_data}
+            )
             response.raise_for_status()
             
             roboflow_data = response.json()
-            return self._process_roboflow_response(roboflow_data)
+            result = self._process_roboflow_response(roboflow_data)
+            self._cache_result(cache_key, result)
+            return result
             
         except Exception as e:
-            logger.error(f"Error detecting PPE from base64: {str(e)}")
+            logger.error(f"Error detecting PPE from bytes: {str(e)}")
             return PPEDetectionResult()
 
-    def detect_ppe_from_file(self, image_path: str) -> PPEDetectionResult:
+    async def detect_ppe_from_file(self, image_path: str) -> PPEDetectionResult:
         """Detect PPE from local image file using Roboflow API"""
         try:
-            with open(image_path, 'rb') as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
+            # Read off the event loop and upload the raw bytes (no base64)
+            image_data = await asyncio.to_thread(_read_file_bytes, image_path)
             
-            return self.detect_ppe_from_base64(image_data)
+            return await self.detect_ppe_from_bytes(image_data)
             
         except Exception as e:
             logger.error(f"Error detecting PPE from file: {str(e)}")
             return PPEDetectionResult()
 
+    async def detect_ppe_batch(self, images: List[str]) -> List[PPEDetectionResult]:
+        """Detect PPE on several images (URLs or base64 strings) concurrently"""
+        return await asyncio.gather(*(
+            self.detect_ppe_from_url(image) if image.startswith(('http://', 'https://'))
+            else self.detect_ppe_from_base64(image)
+            for image in images
+        ))
+
+    def _new_client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client for Roboflow inference calls"""
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_keepalive_connections=32),
+            timeout=10
+        )
+
+    async def aclose(self):
+        """Close the pooled HTTP client; a fresh one serves any later app run"""
+        client, self._client = self._client, self._new_client()
+        await client.aclose()
+
+    def _get_cached_result(self, cache_key: Optional[bytes]) -> Optional[PPEDetectionResult]:
+        """Return a copy of a cached detection result, if any"""
+        if cache_key is None:
+            return None
+        with self._result_cache_lock:
+            result = self._result_cache.get(cache_key)
+        return result.model_copy() if result is not None else None
+
+    def _cache_result(self, cache_key: Optional[bytes], result: PPEDetectionResult):
+        """Remember a successful detection result for its image hash"""
+        if cache_key is None:
+            return
+        with self._result_cache_lock:
+            self._result_cache[cache_key] = result.model_copy()
+
     def _process_roboflow_response(self, roboflow_data: Dict) -> PPEDetectionResult:
         """Process Roboflow API response and extract PPE detection results"""
         result = PPEDetectionResult()
@@ -96,53 +221,41 @@ class PPEDetector:
         
         predictions = roboflow_data['predictions']
         
-        # Process each prediction
+        # Keep the best qualifying confidence per PPE type
+        best_confidence: Dict[str, float] = {}
         for prediction in predictions:
-            class_name = prediction.get('class', '').lower()
             confidence = prediction.get('confidence', 0.0)
             
-            # Check which PPE type this prediction belongs to
-            for ppe_type, class_variants in self.ppe_classes.items():
-                if any(variant in class_name for variant in class_variants):
-                    if confidence >= self.confidence_thresholds[ppe_type]:
-                        self._update_ppe_result(result, ppe_type, confidence)
+            for ppe_type in self._ppe_types_for_class(prediction.get('class', '')):
+                if (confidence >= self.confidence_thresholds[ppe_type]
+                        and confidence > best_confidence.get(ppe_type, -1.0)):
+                    best_confidence[ppe_type] = confidence
         
-        # Calculate compliance
-        result = self._calculate_compliance(result)
+        # Build the result in one go, then score it
+        fields = {}
+        for ppe_type, confidence in best_confidence.items():
+            detected_field, confidence_field = _PPE_FIELDS[ppe_type]
+            fields[detected_field] = True
+            fields[confidence_field] = confidence
         
-        return result
+        return self._calculate_compliance(PPEDetectionResult(**fields))
 
-    def _update_ppe_result(self, result: PPEDetectionResult, ppe_type: str, confidence: float):
-        """Update PPE detection result based on type and confidence"""
-        if ppe_type == 'helmet':
-            result.helmet_detected = True
-            result.helmet_confidence = max(result.helmet_confidence, confidence)
-        elif ppe_type == 'mask':
-            result.mask_detected = True
-            result.mask_confidence = max(result.mask_confidence, confidence)
-        elif ppe_type == 'gloves':
-            result.gloves_detected = True
-            result.gloves_confidence = max(result.gloves_confidence, confidence)
-        elif ppe_type == 'jacket':
-            result.jacket_detected = True
-            result.jacket_confidence = max(result.jacket_confidence, confidence)
+    def _ppe_types_for_class(self, class_name: str) -> Tuple[str, ...]:
+        """PPE types whose variants match a Roboflow class label (memoized)"""
+        ppe_types = self._class_ppe_types.get(class_name)
+        if ppe_types is None:
+            lowered = class_name.lower()
+            ppe_types = tuple(
+                ppe_type for ppe_type, pattern in self._ppe_patterns.items()
+                if pattern.search(lowered)
+            )
+            self._class_ppe_types[class_name] = ppe_types
+        return ppe_types
 
     def _calculate_compliance(self, result: PPEDetectionResult) -> PPEDetectionResult:
         """Calculate overall compliance based on detected PPE items"""
-        required_ppe = ['helmet', 'mask', 'gloves', 'jacket']
-        detected_ppe = []
-        
-        if result.helmet_detected:
-            detected_ppe.append('helmet')
-        if result.mask_detected:
-            detected_ppe.append('mask')
-        if result.gloves_detected:
-            detected_ppe.append('gloves')
-        if result.jacket_detected:
-            detected_ppe.append('jacket')
-        
         # Calculate compliance score (percentage of required PPE detected)
-        compliance_score = len(detected_ppe) / len(required_ppe) * 100
+        compliance_score = sum(_detected_flags(result)) / len(_PPE_TYPES) * 100
         result.compliance_score = compliance_score
         
         # Consider compliant if at least 75% of required PPE is detected
@@ -179,16 +292,10 @@ class PPEDetector:
 
     def _get_missing_items(self, result: PPEDetectionResult) -> List[str]:
         """Get list of missing PPE items"""
-        missing = []
-        if not result.helmet_detected:
-            missing.append('helmet')
-        if not result.mask_detected:
-            missing.append('mask')
-        if not result.gloves_detected:
-            missing.append('gloves')
-        if not result.jacket_detected:
-            missing.append('jacket')
-        return missing
+        return [
+            ppe_type for ppe_type, detected in zip(_PPE_TYPES, _detected_flags(result))
+            if not detected
+        ]
 
     def _get_recommendations(self, result: PPEDetectionResult) -> List[str]:
         """Get safety recommendations based on detection results"""
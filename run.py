@@ -9,7 +9,12 @@ with proper configuration and error handling.
 import os
 import sys
 import logging
+import logging.handlers
+import queue
+import atexit
 import argparse
+import importlib.util
+from functools import lru_cache
 from pathlib import Path
 
 # Add the current directory to Python path
@@ -18,29 +23,49 @@ sys.path.insert(0, str(Path(__file__).parent))
 def setup_logging(debug=False):
     """Set up logging configuration"""
     log_level = logging.DEBUG if debug else logging.INFO
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.StreamHandler(sys.stdout),
+        logging.FileHandler('ppe_compliance.log')
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # Request handlers only enqueue records; a listener thread does the
+    # console and file writes so they never block the event loop
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    # The queue handler passes plain messages; the listener's handlers format them
     logging.basicConfig(
         level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler('ppe_compliance.log')
-        ]
+        format='%(message)s',
+        handlers=[logging.handlers.QueueHandler(log_queue)]
     )
 
+# Required packages as (pip package name, importable module name)
+_REQUIRED_PACKAGES = (
+    ('fastapi', 'fastapi'),
+    ('uvicorn', 'uvicorn'),
+    ('sqlalchemy', 'sqlalchemy'),
+    ('requests', 'requests'),
+    ('python-dotenv', 'dotenv'),
+    ('pydantic', 'pydantic'),
+    ('opencv-python', 'cv2')
+)
+
+@lru_cache(maxsize=1)
 def check_dependencies():
-    """Check if all required dependencies are installed"""
-    required_packages = [
-        'fastapi', 'uvicorn', 'sqlalchemy', 'requests', 
-        'python-dotenv', 'pydantic', 'opencv-python'
+    """Check if all required dependencies are installed (once per process)"""
+    # find_spec locates each module without executing it, so heavy packages
+    # like cv2 are never initialized just to be checked
+    missing_packages = [
+        package for package, module in _REQUIRED_PACKAGES
+        if importlib.util.find_spec(module) is None
     ]
     
-    missing_packages = []
-    for package in required_packages:
-        try:
-            __import__(package.replace('-', '_'))
-        except ImportError:
-            missing_packages.append(package)
-    
     if missing_packages:
         print("❌ Missing required packages:")
         for package in missing_packages:
@@ -176,7 +201,7 @@ Examples:
     print("🛡️  Smart PPE Compliance Checker")
     print("=" * 40)
     
-    # Check dependencies
+    # Single-purpose runs exit before the checks needed to start the server
     if args.check_deps:
         if check_dependencies():
             print("✅ All dependencies are installed")
@@ -184,10 +209,6 @@ Examples:
         else:
             sys.exit(1)
     
-    if not check_dependencies():
-        sys.exit(1)
-    
-    # Check configuration
     if args.check_config:
         if check_configuration():
             print("✅ Configuration is valid")
@@ -195,17 +216,21 @@ Examples:
         else:
             sys.exit(1)
     
-    if not check_configuration():
-        print("\n💡 Run 'python run.py --check-config' for detailed configuration check")
-        sys.exit(1)
-    
-    # Initialize database
     if args.init_db:
         if initialize_database():
             sys.exit(0)
         else:
             sys.exit(1)
     
+    # Check dependencies and configuration
+    if not check_dependencies():
+        sys.exit(1)
+    
+    if not check_configuration():
+        print("\n💡 Run 'python run.py --check-config' for detailed configuration check")
+        sys.exit(1)
+    
+    # Initialize database
     if not initialize_database():
         sys.exit(1)
     
@@ -1,8 +1,14 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
-class PPEDetectionResult(BaseModel):
+class _Schema(BaseModel):
+    # Build validators on first use rather than at import time. Request body
+    # models subclass BaseModel directly: FastAPI builds those when routes are
+    # registered, and deferring them trips pydantic's alias warnings.
+    model_config = ConfigDict(defer_build=True)
+
+class PPEDetectionResult(_Schema):
     helmet_detected: bool = False
     mask_detected: bool = False
     gloves_detected: bool = False
@@ -16,7 +22,7 @@ class PPEDetectionResult(BaseModel):
     is_compliant: bool = False
     compliance_score: float = 0.0
 
-class RoboflowDetection(BaseModel):
+class RoboflowDetection(_Schema):
     class_name: str
     confidence: float
     x: float
@@ -24,7 +30,7 @@ class RoboflowDetection(BaseModel):
     width: float
     height: float
 
-class RoboflowResponse(BaseModel):
+class RoboflowResponse(_Schema):
     predictions: List[RoboflowDetection]
     image: str
 
@@ -37,7 +43,7 @@ class ComplianceCheckRequest(BaseModel):
     image_url: Optional[str] = None
     image_base64: Optional[str] = None
 
-class ComplianceCheckResponse(BaseModel):
+class ComplianceCheckResponse(_Schema):
     success: bool
     message: str
     data: Optional[PPEDetectionResult] = None
@@ -53,7 +59,9 @@ class WorkerCreate(BaseModel):
     phone: Optional[str] = None
     shift: Optional[str] = None
 
-class WorkerResponse(BaseModel):
+class WorkerResponse(_Schema):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     worker_id: str
     name: str
@@ -66,7 +74,9 @@ class WorkerResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-class ComplianceRecordResponse(BaseModel):
+class ComplianceRecordResponse(_Schema):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: int
     worker_id: str
     worker_name: Optional[str]
@@ -94,7 +104,7 @@ class AlertRequest(BaseModel):
     message: str
     channels: List[str] = ["slack", "email"]
 
-class DashboardStats(BaseModel):
+class DashboardStats(_Schema):
     total_checks: int
     compliant_checks: int
     non_compliant_checks: int
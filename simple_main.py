@@ -1,26 +1,37 @@
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
+from sqlalchemy import func, case, select
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 import logging
 import os
-import base64
 from datetime import datetime, timedelta
-import json
-import random
 
 # Import our modules
-from models import get_db, create_tables, PPEComplianceRecord, Worker, ComplianceAlert
+from models import get_db, create_tables, PPEComplianceRecord, Worker, ComplianceAlert, get_worker_by_worker_id
 from schemas import (
     ComplianceCheckRequest, ComplianceCheckResponse, WorkerCreate, WorkerResponse,
-    ComplianceRecordResponse, DashboardStats, WebhookPayload, AlertRequest
+    ComplianceRecordResponse, DashboardStats, WebhookPayload, AlertRequest, PPEDetectionResult
 )
+import json_utils
+from config import settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# List endpoints select exactly the response-model columns as plain rows,
+# skipping ORM instance hydration and the identity map
+_WORKER_COLUMNS = tuple(getattr(Worker, name) for name in WorkerResponse.model_fields)
+_RECORD_COLUMNS = tuple(getattr(PPEComplianceRecord, name) for name in ComplianceRecordResponse.model_fields)
+
+# Latest violations for the dashboard; the statement is fixed, so build it once
+_RECENT_VIOLATIONS = select(*_RECORD_COLUMNS)\
+    .where(PPEComplianceRecord.is_compliant == False)\
+    .order_by(PPEComplianceRecord.timestamp.desc())\
+    .limit(10)
+
 # Create FastAPI app
 app = FastAPI(
     title="Smart PPE Compliance Checker - Demo Version",
@@ -37,11 +48,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create database tables on startup
+# Create database tables on startup (unless the schema is managed at deploy time)
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
-    logger.info("Database tables created successfully")
+    if settings.AUTO_CREATE_TABLES:
+        create_tables()
+        logger.info("Database tables created successfully")
 
 # Health check endpoint
 @app.get("/health")
@@ -49,22 +61,42 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat(), "mode": "demo"}
 
 # Mock PPE Detection for Demo
+# Detection chance and confidence range per item (helmet, mask, gloves, jacket)
+_MOCK_DETECTION_RATES = (0.75, 0.5, 0.75, 0.5)
+_MOCK_CONFIDENCE_LOW = (0.7, 0.6, 0.7, 0.6)
+_MOCK_CONFIDENCE_HIGH = (0.95, 0.9, 0.9, 0.85)
+
+# Mock results are drawn in blocks and handed out one row per request, so the
+# RNG is called once per _MOCK_BLOCK_SIZE checks instead of eight times each
+_MOCK_BLOCK_SIZE = 1024
+_rng = None
+_mock_rows = []
+
+def _refill_mock_rows():
+    """Draw the next block of mock detection flags and confidences"""
+    global _rng
+    # numpy is only needed for mock detection, so load it on the first check
+    # rather than at startup
+    if _rng is None:
+        import numpy as np
+        _rng = np.random.default_rng()
+    
+    shape = (_MOCK_BLOCK_SIZE, len(_MOCK_DETECTION_RATES))
+    detected = _rng.random(shape) < _MOCK_DETECTION_RATES
+    confidences = _rng.uniform(_MOCK_CONFIDENCE_LOW, _MOCK_CONFIDENCE_HIGH, shape) * detected
+    _mock_rows.extend(zip(detected.tolist(), confidences.tolist()))
+
 def mock_ppe_detection() -> Dict[str, Any]:
     """Mock PPE detection for demo purposes"""
     # Simulate realistic detection results
-    helmet_detected = random.choice([True, True, True, False])  # 75% chance
-    mask_detected = random.choice([True, True, False, False])   # 50% chance
-    gloves_detected = random.choice([True, True, True, False])  # 75% chance
-    jacket_detected = random.choice([True, True, False, False]) # 50% chance
-    
-    helmet_confidence = random.uniform(0.7, 0.95) if helmet_detected else 0.0
-    mask_confidence = random.uniform(0.6, 0.9) if mask_detected else 0.0
-    gloves_confidence = random.uniform(0.7, 0.9) if gloves_detected else 0.0
-    jacket_confidence = random.uniform(0.6, 0.85) if jacket_detected else 0.0
+    if not _mock_rows:
+        _refill_mock_rows()
+    detected, confidences = _mock_rows.pop()
+    helmet_detected, mask_detected, gloves_detected, jacket_detected = detected
+    helmet_confidence, mask_confidence, gloves_confidence, jacket_confidence = confidences
     
     # Calculate compliance
-    detected_count = sum([helmet_detected, mask_detected, gloves_detected, jacket_detected])
-    compliance_score = (detected_count / 4) * 100
+    compliance_score = (sum(detected) / 4) * 100
     is_compliant = compliance_score >= 75.0
     
     return {
@@ -81,6 +113,57 @@ def mock_ppe_detection() -> Dict[str, Any]:
     }
 
 # PPE Compliance Check Endpoints
+async def _do_compliance_check(request: ComplianceCheckRequest, db: Session) -> ComplianceCheckResponse:
+    """Run a demo compliance check; shared by the check, upload and webhook endpoints"""
+    # Get or create worker
+    worker = get_worker_by_worker_id(db, request.worker_id)
+    
+    if not worker:
+        worker = Worker(
+            worker_id=request.worker_id,
+            name=request.worker_name or "Unknown",
+            department=request.department or "Unknown",
+            shift=request.shift
+        )
+        db.add(worker)
+    
+    # Mock PPE detection
+    detection_result = mock_ppe_detection()
+    detection_model = PPEDetectionResult(**detection_result)
+    
+    # Create compliance record
+    record = PPEComplianceRecord(
+        worker_id=request.worker_id,
+        worker_name=worker.name,
+        **detection_result,
+        location=request.location,
+        department=request.department or worker.department,
+        shift=request.shift or worker.shift,
+        raw_detection_data=json_utils.dumps(detection_result)
+    )
+    
+    # A new worker and the record are written in one transaction; flush to
+    # get the record ID before the commit expires the loaded attributes
+    db.add(record)
+    db.flush()
+    record_id = record.id
+    worker_name = worker.name
+    db.commit()
+    
+    # Mock alert sending
+    alert_sent = False
+    if not detection_model.is_compliant:
+        alert_sent = True
+        logger.info(f"Mock alert sent for non-compliant worker: {worker_name}")
+    
+    return ComplianceCheckResponse(
+        success=True,
+        message="Compliance check completed successfully (Demo Mode)",
+        data=detection_model,
+        record_id=record_id,
+        alert_sent=alert_sent
+    )
+
 @app.post("/api/compliance/check", response_model=ComplianceCheckResponse)
 async def check_compliance(
     request: ComplianceCheckRequest,
@@ -89,66 +172,13 @@ async def check_compliance(
 ):
     """Main endpoint for PPE compliance checking (Demo Mode)"""
     try:
-        # Get or create worker
-        worker = db.query(Worker).filter(Worker.worker_id == request.worker_id).first()
-        
-        if not worker:
-            worker = Worker(
-                worker_id=request.worker_id,
-                name=request.worker_name or "Unknown",
-                department=request.department or "Unknown",
-                shift=request.shift
-            )
-            db.add(worker)
-            db.commit()
-            db.refresh(worker)
-        
-        # Mock PPE detection
-        detection_result = mock_ppe_detection()
-        
-        # Create compliance record
-        record = PPEComplianceRecord(
-            worker_id=request.worker_id,
-            worker_name=worker.name,
-            helmet_detected=detection_result["helmet_detected"],
-            mask_detected=detection_result["mask_detected"],
-            gloves_detected=detection_result["gloves_detected"],
-            jacket_detected=detection_result["jacket_detected"],
-            helmet_confidence=detection_result["helmet_confidence"],
-            mask_confidence=detection_result["mask_confidence"],
-            gloves_confidence=detection_result["gloves_confidence"],
-            jacket_confidence=detection_result["jacket_confidence"],
-            is_compliant=detection_result["is_compliant"],
-            compliance_score=detection_result["compliance_score"],
-            location=request.location,
-            department=request.department or worker.department,
-            shift=request.shift or worker.shift,
-            raw_detection_data=json.dumps(detection_result)
-        )
-        
-        db.add(record)
-        db.commit()
-        db.refresh(record)
-        
-        # Mock alert sending
-        alert_sent = False
-        if not detection_result["is_compliant"]:
-            alert_sent = True
-            logger.info(f"Mock alert sent for non-compliant worker: {worker.name}")
-        
-        return ComplianceCheckResponse(
-            success=True,
-            message="Compliance check completed successfully (Demo Mode)",
-            data=detection_result,
-            record_id=record.id,
-            alert_sent=alert_sent
-        )
+        return await _do_compliance_check(request, db)
         
     except Exception as e:
         logger.error(f"Error in compliance check: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/compliance/check-upload")
+@app.post("/api/compliance/check-upload", response_model=ComplianceCheckResponse)
 async def check_compliance_upload(
     background_tasks: BackgroundTasks,
     worker_id: str = Form(...),
@@ -161,21 +191,18 @@ async def check_compliance_upload(
 ):
     """Check compliance from uploaded image file (Demo Mode)"""
     try:
-        # Read image data (we'll just use it for demo purposes)
-        image_data = await file.read()
-        
-        # Create request
+        # Detection is mocked, so the upload stays in its spooled temp file
+        # instead of being read and base64-encoded
         request = ComplianceCheckRequest(
             worker_id=worker_id,
             worker_name=worker_name,
             location=location,
             department=department,
-            shift=shift,
-            image_base64=base64.b64encode(image_data).decode('utf-8')
+            shift=shift
         )
         
         # Use the same logic as the regular check endpoint
-        return await check_compliance(request, background_tasks, db)
+        return await _do_compliance_check(request, db)
         
     except Exception as e:
         logger.error(f"Error in compliance check upload: {str(e)}")
@@ -187,7 +214,7 @@ async def create_worker(worker: WorkerCreate, db: Session = Depends(get_db)):
     """Create a new worker"""
     try:
         # Check if worker already exists
-        existing_worker = db.query(Worker).filter(Worker.worker_id == worker.worker_id).first()
+        existing_worker = get_worker_by_worker_id(db, worker.worker_id)
         if existing_worker:
             raise HTTPException(status_code=400, detail="Worker ID already exists")
         
@@ -207,8 +234,7 @@ async def create_worker(worker: WorkerCreate, db: Session = Depends(get_db)):
 async def get_workers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Get list of workers"""
     try:
-        workers = db.query(Worker).offset(skip).limit(limit).all()
-        return workers
+        return db.execute(select(*_WORKER_COLUMNS).offset(skip).limit(limit)).all()
         
     except Exception as e:
         logger.error(f"Error getting workers: {str(e)}")
@@ -218,7 +244,7 @@ async def get_workers(skip: int = 0, limit: int = 100, db: Session = Depends(get
 async def get_worker(worker_id: str, db: Session = Depends(get_db)):
     """Get specific worker by ID"""
     try:
-        worker = db.query(Worker).filter(Worker.worker_id == worker_id).first()
+        worker = get_worker_by_worker_id(db, worker_id)
         if not worker:
             raise HTTPException(status_code=404, detail="Worker not found")
         
@@ -240,17 +266,17 @@ async def get_compliance_records(
 ):
     """Get compliance records with optional filters"""
     try:
-        query = db.query(PPEComplianceRecord)
+        query = select(*_RECORD_COLUMNS)
         
         if worker_id:
-            query = query.filter(PPEComplianceRecord.worker_id == worker_id)
+            query = query.where(PPEComplianceRecord.worker_id == worker_id)
         if department:
-            query = query.filter(PPEComplianceRecord.department == department)
+            query = query.where(PPEComplianceRecord.department == department)
         if is_compliant is not None:
-            query = query.filter(PPEComplianceRecord.is_compliant == is_compliant)
+            query = query.where(PPEComplianceRecord.is_compliant == is_compliant)
         
-        records = query.order_by(PPEComplianceRecord.timestamp.desc()).offset(skip).limit(limit).all()
-        return records
+        query = query.order_by(PPEComplianceRecord.timestamp.desc()).offset(skip).limit(limit)
+        return db.execute(query).all()
         
     except Exception as e:
         logger.error(f"Error getting compliance records: {str(e)}")
@@ -279,42 +305,40 @@ async def get_dashboard_stats(
 ):
     """Get dashboard statistics"""
     try:
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        query = db.query(PPEComplianceRecord).filter(
-            PPEComplianceRecord.timestamp >= start_date
-        )
-        
-        if department:
-            query = query.filter(PPEComplianceRecord.department == department)
-        
-        records = query.all()
-        
-        total_checks = len(records)
-        compliant_checks = len([r for r in records if r.is_compliant])
-        non_compliant_checks = total_checks - compliant_checks
-        compliance_rate = (compliant_checks / total_checks * 100) if total_checks > 0 else 0
-        
-        # Get today's stats
-        today = datetime.utcnow().date()
-        today_records = db.query(PPEComplianceRecord).filter(
-            PPEComplianceRecord.timestamp >= today
-        ).all()
-        
-        today_total = len(today_records)
-        today_compliant = len([r for r in today_records if r.is_compliant])
-        today_non_compliant = today_total - today_compliant
-        today_rate = (today_compliant / today_total * 100) if today_total > 0 else 0
-        
-        # Department breakdown
+        # Read the clock once so the window and today boundaries agree
+        now = datetime.utcnow()
+        start_date = now - timedelta(days=days)
+        today = now.date()
+        today_start = datetime.combine(today, datetime.min.time())
+        
+        # Window and today counts come from one grouped scan over whichever
+        # range starts earlier; conditional sums split the two periods
+        in_window = PPEComplianceRecord.timestamp >= start_date
+        in_today = PPEComplianceRecord.timestamp >= today_start
+        compliant = PPEComplianceRecord.is_compliant
+        rows = db.query(
+            PPEComplianceRecord.department,
+            func.sum(case((in_window, 1), else_=0)),
+            func.sum(case((in_window & compliant, 1), else_=0)),
+            func.sum(case((in_today, 1), else_=0)),
+            func.sum(case((in_today & compliant, 1), else_=0))
+        ).filter(PPEComplianceRecord.timestamp >= min(start_date, today_start))\
+            .group_by(PPEComplianceRecord.department)\
+            .all()
+        
+        # Department breakdown (today's stats cover every department)
         departments = {}
-        for record in records:
-            dept = record.department or 'Unknown'
+        today_total = today_compliant = 0
+        for dept, total, compliant_total, today_dept_total, today_dept_compliant in rows:
+            today_total += today_dept_total or 0
+            today_compliant += today_dept_compliant or 0
+            if not total or (department and dept != department):
+                continue
+            dept = dept or 'Unknown'
             if dept not in departments:
                 departments[dept] = {'total': 0, 'compliant': 0}
-            departments[dept]['total'] += 1
-            if record.is_compliant:
-                departments[dept]['compliant'] += 1
+            departments[dept]['total'] += total
+            departments[dept]['compliant'] += compliant_total or 0
         
         # Calculate department rates
         for dept in departments:
@@ -322,10 +346,16 @@ async def get_dashboard_stats(
             compliant = departments[dept]['compliant']
             departments[dept]['rate'] = (compliant / total * 100) if total > 0 else 0
         
+        total_checks = sum(dept['total'] for dept in departments.values())
+        compliant_checks = sum(dept['compliant'] for dept in departments.values())
+        non_compliant_checks = total_checks - compliant_checks
+        compliance_rate = (compliant_checks / total_checks * 100) if total_checks > 0 else 0
+        
+        today_non_compliant = today_total - today_compliant
+        today_rate = (today_compliant / today_total * 100) if today_total > 0 else 0
+        
         # Get recent violations
-        recent_violations = db.query(PPEComplianceRecord).filter(
-            PPEComplianceRecord.is_compliant == False
-        ).order_by(PPEComplianceRecord.timestamp.desc()).limit(10).all()
+        recent_violations = db.execute(_RECENT_VIOLATIONS).all()
         
         return DashboardStats(
             total_checks=total_checks,
@@ -371,15 +401,10 @@ async def compliance_webhook(
             )
             
             # Process compliance check
-            result = await check_compliance(request, background_tasks, db)
+            result = await _do_compliance_check(request, db)
             
-            return {
-                "success": result.success,
-                "message": result.message,
-                "data": result.data.dict() if result.data else None,
-                "record_id": result.record_id,
-                "alert_sent": result.alert_sent
-            }
+            # Serialize the check result in one pass with pydantic-core
+            return Response(content=result.model_dump_json(), media_type="application/json")
         
         else:
             return {"success": False, "message": f"Unknown event type: {payload.event_type}"}
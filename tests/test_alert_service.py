@@ -0,0 +1,93 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from alert_service import CircuitBreaker, alert_service, _record_fields
+from models import PPEComplianceRecord
+
+
+def _make_record(**overrides) -> PPEComplianceRecord:
+    values = dict(
+        worker_id="W001",
+        worker_name="Jane Doe",
+        timestamp=datetime(2024, 1, 15, 8, 30, 0),
+        helmet_detected=True,
+        mask_detected=False,
+        gloves_detected=True,
+        jacket_detected=False,
+        helmet_confidence=0.91,
+        mask_confidence=0.0,
+        gloves_confidence=0.78,
+        jacket_confidence=0.0,
+        is_compliant=False,
+        compliance_score=50.0,
+        location="Site A",
+        department="Construction",
+        shift="Morning",
+    )
+    values.update(overrides)
+    return PPEComplianceRecord(**values)
+
+
+class SlackBlocksTest(unittest.TestCase):
+    def test_blocks_include_worker_score_and_ppe_rows(self):
+        record = _make_record()
+        blocks = alert_service._create_slack_blocks("Missing PPE", record, _record_fields(record))
+
+        self.assertEqual([block["type"] for block in blocks], ["header", "section", "section", "divider"])
+
+        summary = [field["text"] for field in blocks[1]["fields"]]
+        self.assertIn("*Worker:* Jane Doe\n*ID:* W001", summary)
+        self.assertIn("*Compliance Score:* 50.0%\n*Status:* ❌ Non-Compliant", summary)
+
+        details = blocks[2]["text"]["text"]
+        self.assertIn("Helmet: ✅ (91.0%)", details)
+        self.assertIn("Mask: ❌", details)
+
+    def test_compliant_record_status(self):
+        record = _make_record(is_compliant=True, compliance_score=100.0)
+        blocks = alert_service._create_slack_blocks("All good", record, _record_fields(record))
+
+        self.assertIn("*Status:* ✅ Compliant", blocks[1]["fields"][3]["text"])
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def _open_breaker(self, clock) -> CircuitBreaker:
+        breaker = CircuitBreaker("Test", fail_max=2, reset_timeout=60)
+        with mock.patch("alert_service.time.monotonic", return_value=clock):
+            breaker.record_failure()
+            breaker.record_failure()
+        return breaker
+
+    def test_opens_after_fail_max_failures(self):
+        breaker = self._open_breaker(clock=100)
+        with mock.patch("alert_service.time.monotonic", return_value=130):
+            self.assertFalse(breaker.allow())
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = self._open_breaker(clock=100)
+        with mock.patch("alert_service.time.monotonic", return_value=161):
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            self.assertFalse(breaker.allow())
+
+    def test_trial_success_closes_the_circuit(self):
+        breaker = self._open_breaker(clock=100)
+        with mock.patch("alert_service.time.monotonic", return_value=161):
+            breaker.allow()
+            breaker.record_success()
+            self.assertTrue(breaker.allow())
+            self.assertTrue(breaker.allow())
+
+    def test_trial_failure_reopens_the_circuit(self):
+        breaker = self._open_breaker(clock=100)
+        with mock.patch("alert_service.time.monotonic", return_value=161):
+            breaker.allow()
+            breaker.record_failure()
+            self.assertFalse(breaker.allow())
+        with mock.patch("alert_service.time.monotonic", return_value=222):
+            self.assertTrue(breaker.allow())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import compliance_service
+from compliance_service import ComplianceService
+from models import Base, PPEComplianceRecord
+from schemas import ComplianceCheckRequest, PPEDetectionResult
+
+
+def _detection(score: float) -> PPEDetectionResult:
+    return PPEDetectionResult(
+        helmet_detected=True,
+        mask_detected=True,
+        gloves_detected=True,
+        jacket_detected=True,
+        is_compliant=True,
+        compliance_score=score,
+    )
+
+
+class RecordWriterTestCase(unittest.TestCase):
+    """Runs the record writer against an in-memory database with detection mocked out"""
+
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        self.addCleanup(engine.dispose)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        patcher = mock.patch.object(compliance_service, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # The score is taken from the image URL so each check stores a distinct row
+        detector = mock.patch.object(
+            compliance_service.ppe_detector,
+            "detect_ppe_from_url",
+            new=mock.AsyncMock(side_effect=lambda url: _detection(float(url.rsplit("/", 1)[1]))),
+        )
+        detector.start()
+        self.addCleanup(detector.stop)
+
+    def _request(self, worker_id: str, score: int) -> ComplianceCheckRequest:
+        return ComplianceCheckRequest(worker_id=worker_id, image_url=f"http://images/{score}")
+
+    def _stored_row(self, record_id: int):
+        with self.Session() as db:
+            return db.execute(
+                select(PPEComplianceRecord.worker_id, PPEComplianceRecord.compliance_score)
+                .where(PPEComplianceRecord.id == record_id)
+            ).one_or_none()
+
+
+class RecordBatchTest(RecordWriterTestCase):
+    def test_concurrent_checks_get_distinct_ordered_ids(self):
+        service = ComplianceService()
+        requests = [self._request(f"W{i % 7}", i) for i in range(50)]
+
+        async def run():
+            try:
+                return await asyncio.gather(*(service.check_compliance(request) for request in requests))
+            finally:
+                await service.aclose()
+
+        responses = asyncio.run(run())
+
+        self.assertTrue(all(response.success for response in responses))
+        record_ids = [response.record_id for response in responses]
+        self.assertEqual(len(set(record_ids)), len(record_ids))
+        self.assertEqual(record_ids, sorted(record_ids))
+        for request, record_id, score in zip(requests, record_ids, range(50)):
+            self.assertEqual(tuple(self._stored_row(record_id)), (request.worker_id, float(score)))
+
+    def test_bad_item_does_not_fail_the_batch(self):
+        service = ComplianceService()
+        requests = [self._request("W1", 10), self._request("BAD", 20), self._request("W2", 30)]
+        record_values = service._compliance_record_values
+
+        def failing_record_values(request, detection_result, worker):
+            if request.worker_id == "BAD":
+                raise ValueError("bad record")
+            return record_values(request, detection_result, worker)
+
+        async def run():
+            try:
+                return await asyncio.gather(*(service.check_compliance(request) for request in requests))
+            finally:
+                await service.aclose()
+
+        with mock.patch.object(service, "_compliance_record_values", side_effect=failing_record_values), \
+                self.assertLogs("compliance_service", "WARNING") as logs:
+            good, bad, other = asyncio.run(run())
+
+        self.assertIn("retrying individually", logs.output[0])
+        self.assertFalse(bad.success)
+        self.assertIsNone(bad.record_id)
+        self.assertEqual(tuple(self._stored_row(good.record_id)), ("W1", 10.0))
+        self.assertEqual(tuple(self._stored_row(other.record_id)), ("W2", 30.0))
+
+
+class AppLifespanTest(RecordWriterTestCase):
+    def test_consecutive_lifespans_complete(self):
+        import main
+
+        results = []
+
+        def run_lifespans():
+            for lifespan in range(2):
+                with TestClient(main.app) as client:
+                    for i in range(3):
+                        response = client.post(
+                            "/api/compliance/check",
+                            json={"worker_id": f"L{lifespan}", "image_url": f"http://images/{i}"},
+                        )
+                        results.append((response.status_code, response.json().get("success")))
+
+        # Table creation, connection warm-up and external storage are not under test
+        with mock.patch.object(main, "create_tables"), \
+                mock.patch.object(main.alert_service, "warm_connections"), \
+                mock.patch.object(main.data_storage, "log_compliance_record_by_id"):
+            thread = threading.Thread(target=run_lifespans, daemon=True)
+            thread.start()
+            thread.join(timeout=30)
+
+        self.assertFalse(thread.is_alive(), "app lifespan hung")
+        self.assertEqual(results, [(200, True)] * 6)
+
+
+if __name__ == "__main__":
+    unittest.main()